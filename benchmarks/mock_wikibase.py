@@ -0,0 +1,347 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import argparse
+import collections
+import gzip
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+
+
+API_PATH = '/api.php'
+SPARQL_PATH = '/bigdata/sparql'
+STATS_PATH = '/stats'
+SEARCH_PREFIX_LENGTH = 6
+
+
+class MockWikibaseStore:
+    """
+    In-memory store of items used by the mock server, with counters of handled API calls
+    """
+
+    def __init__(self, first_id: int = 1):
+        """
+        Args:
+            first_id (int): numeric ID of the first created item
+        """
+        self.entities: Dict[str, dict] = {}
+        self._search_index: Dict[str, set] = collections.defaultdict(set)
+        self.calls = collections.Counter()
+        self.bytes_sent = 0
+        self._ids = itertools.count(first_id)
+        self._revisions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_entity(self, entity_json: dict, entity_id: Optional[str] = None) -> dict:
+        """
+        Adds new item (or replaces data of the existing item) and assigns IDs to its statements
+        Args:
+            entity_json (dict): item data in 'wbeditentity' format
+            entity_id (Optional[str]): ID of the existing item
+        Returns:
+            dict: complete stored item
+        """
+        with self._lock:
+            if entity_id is None:
+                entity_id = 'Q' + str(next(self._ids))
+                entity = { 'type': 'item', 'id': entity_id, 'labels': {}, 'descriptions': {}, 'aliases': {},
+                           'claims': {}, 'sitelinks': {} }
+            else:
+                entity = self.entities[entity_id]
+            for key in ('labels', 'descriptions'):
+                for language, value in entity_json.get(key, {}).items():
+                    if 'remove' in value:
+                        entity[key].pop(language, None)
+                    else:
+                        entity[key][language] = { 'language': language, 'value': value['value'] }
+            for language, values in entity_json.get('aliases', {}).items():
+                values = values if isinstance(values, list) else [values]
+                entity['aliases'][language] = [{ 'language': language, 'value': value['value'] } for value in values
+                                               if 'remove' not in value]
+            for prop_id, claims in entity_json.get('claims', {}).items():
+                for claim in claims:
+                    existing_claims = entity['claims'].setdefault(prop_id, [])
+                    if claim.get('id'):
+                        existing_claims[:] = [c for c in existing_claims if c['id'] != claim['id']]
+                    if 'remove' in claim:
+                        continue
+                    existing_claims.append(_complete_claim(entity_id, claim))
+                if not entity['claims'].get(prop_id):
+                    entity['claims'].pop(prop_id, None)
+            for name in _get_names(entity):
+                self._search_index[name.lower()[:SEARCH_PREFIX_LENGTH]].add(entity_id)
+            entity['lastrevid'] = next(self._revisions)
+            entity['modified'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            self.entities[entity_id] = entity
+            return entity
+
+    def search(self, text: str, language: str) -> list:
+        """
+        Args:
+            text (str): searched text (prefix of the label or alias)
+            language (str): language of the labels
+        Returns:
+            list: IDs of matching items
+        """
+        text = text.lower()
+        with self._lock:
+            if len(text) >= SEARCH_PREFIX_LENGTH:
+                candidates = set(self._search_index.get(text[:SEARCH_PREFIX_LENGTH], ()))
+            else:
+                candidates = set()
+                for prefix, ids in self._search_index.items():
+                    if prefix.startswith(text):
+                        candidates.update(ids)
+            entities = [(entity_id, self.entities[entity_id]) for entity_id in candidates]
+        result = [entity_id for entity_id, entity in entities
+                  if any(name.lower().startswith(text) for name in _get_names(entity))]
+        return sorted(result, key=lambda entity_id: int(entity_id[1:]))
+
+
+def _get_names(entity: dict) -> list:
+    names = [label['value'] for label in entity['labels'].values()]
+    return names + [alias['value'] for aliases in entity['aliases'].values() for alias in aliases]
+
+
+def _snak_hash(snak: dict) -> str:
+    return hashlib.sha1(json.dumps([snak.get('property'), snak.get('datavalue')], sort_keys=True).encode()).hexdigest()
+
+
+def _complete_snak(snak: dict) -> dict:
+    snak = dict(snak)
+    snak['hash'] = _snak_hash(snak)
+    return snak
+
+
+def _complete_claim(entity_id: str, claim: dict) -> dict:
+    claim = dict(claim)
+    claim['id'] = claim.get('id') or entity_id + '$' + str(uuid.uuid4())
+    claim['mainsnak'] = _complete_snak(claim['mainsnak'])
+    claim.setdefault('type', 'statement')
+    claim.setdefault('rank', 'normal')
+    qualifiers = { prop_id: [_complete_snak(snak) for snak in snaks] for prop_id, snaks in claim.get('qualifiers', {}).items() }
+    claim['qualifiers'] = qualifiers
+    claim['qualifiers-order'] = list(qualifiers)
+    references = []
+    for reference in claim.get('references', []):
+        snaks = { prop_id: [_complete_snak(snak) for snak in snaks] for prop_id, snaks in reference['snaks'].items() }
+        references.append({ 'hash': hashlib.sha1(json.dumps(snaks, sort_keys=True).encode()).hexdigest(),
+                            'snaks': snaks, 'snaks-order': list(snaks) })
+    claim['references'] = references
+    return claim
+
+
+def _get_direct_value(claim: dict) -> Optional[str]:
+    datavalue = claim['mainsnak'].get('datavalue')
+    if datavalue is None:
+        return None
+    value = datavalue['value']
+    return value['id'] if isinstance(value, dict) and 'id' in value else value
+
+
+ENTITY_INFO_KEYS = ('pageid', 'ns', 'title', 'lastrevid', 'modified')
+LANGUAGE_SECTIONS = ('labels', 'descriptions', 'aliases')
+
+
+def _project_entity(entity: dict, props: Optional[str], languages: Optional[str]) -> dict:
+    """
+    Limits the entity to given parts and languages, like 'props' and 'languages' parameters of 'wbgetentities'
+    """
+    if props:
+        sections = set(props.split('|'))
+        entity = { key: value for key, value in entity.items()
+                   if key in ('type', 'id') or key in sections or ('info' in sections and key in ENTITY_INFO_KEYS) }
+    if languages:
+        codes = set(languages.split('|'))
+        entity = dict(entity)
+        for section in LANGUAGE_SECTIONS:
+            if section in entity:
+                entity[section] = { code: value for code, value in entity[section].items() if code in codes }
+    return entity
+
+
+def _answer_sparql(store: MockWikibaseStore, query: str) -> dict:
+    """
+    Answers the queries used by the importer: 'VALUES' lists of labels (optionally with values of
+    one property) matched against items; other queries get an empty result
+    """
+    values_match = re.search(r'VALUES\s+(\(.*?\)|\?\w+)\s*\{(.*?)\}\s*\?item', query, re.S)
+    if values_match is None:
+        return { 'head': { 'vars': [] }, 'results': { 'bindings': [] } }
+    variables = re.findall(r'\?(\w+)', values_match.group(1))
+    literals = re.findall(r'"((?:[^"\\]|\\.)*)"(?:@\w+)?', values_match.group(2))
+    literals = [literal.replace('\\"', '"').replace('\\\\', '\\') for literal in literals]
+    rows = [literals[i:i + len(variables)] for i in range(0, len(literals), len(variables))]
+    property_match = re.search(r'wdt:(P\d+)\s+(wd:(Q\d+)|\?(\w+))', query)
+    rows_by_label = collections.defaultdict(list)
+    for row in rows:
+        values = dict(zip(variables, row))
+        rows_by_label[values.get('label')].append(values)
+    bindings = []
+    for entity_id, entity in list(store.entities.items()):
+        label = entity['labels'].get('pl', {}).get('value')
+        for values in rows_by_label.get(label, ()):
+            if property_match is not None:
+                prop_id = property_match.group(1)
+                expected_value = property_match.group(3) or values.get(property_match.group(4))
+                if expected_value not in [_get_direct_value(claim) for claim in entity['claims'].get(prop_id, [])]:
+                    continue
+            binding = { 'item': { 'type': 'uri', 'value': 'http://mock.wikibase/entity/' + entity_id } }
+            for variable, value in values.items():
+                binding[variable] = { 'type': 'literal', 'value': value }
+            bindings.append(binding)
+    return { 'head': { 'vars': ['item'] + variables }, 'results': { 'bindings': bindings } }
+
+
+class MockWikibaseHandler(BaseHTTPRequestHandler):
+    """
+    Handles the subset of MediaWiki Action API (login, tokens, userinfo, wbsearchentities, wbgetentities,
+    wbeditentity) and SPARQL used by the importer
+    """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately, so without this every response waits for delayed ACK
+    disable_nagle_algorithm = True
+    store: MockWikibaseStore = None
+    latency: float = 0.0
+
+    def do_GET(self):
+        self._handle(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(body))
+        self._handle(params)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: dict, status: int = 200):
+        content = json.dumps(data).encode('utf-8')
+        compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compressed:
+            content = gzip.compress(content, compresslevel=1)
+        self.store.bytes_sent += len(content)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, params: dict):
+        params = { key: values[0] for key, values in params.items() }
+        path = urlparse(self.path).path
+        if path == STATS_PATH:
+            self._send_json({ 'calls': dict(self.store.calls), 'bytes_sent': self.store.bytes_sent,
+                              'entities': len(self.store.entities) })
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if path == SPARQL_PATH:
+            self.store.calls['sparql'] += 1
+            self._send_json(_answer_sparql(self.store, params.get('query', '')))
+            return
+        if path != API_PATH:
+            self._send_json({ 'error': { 'code': 'notfound' } }, status=404)
+            return
+        action = params.get('action', '')
+        self.store.calls[action] += 1
+        handler = getattr(self, '_action_' + action, None)
+        if handler is None:
+            self._send_json({ 'error': { 'code': 'badvalue', 'info': 'Unsupported action ' + action } })
+            return
+        self._send_json(handler(params))
+
+    def _action_query(self, params: dict) -> dict:
+        if params.get('meta') == 'tokens':
+            return { 'query': { 'tokens': { 'logintoken': 'mock-login-token+\\', 'csrftoken': 'mock-csrf-token+\\' } } }
+        if params.get('meta') == 'userinfo':
+            return { 'query': { 'userinfo': { 'id': 1, 'name': 'MockBot', 'rights': ['edit', 'bot', 'apihighlimits'] } } }
+        if params.get('prop') == 'info':
+            pages = {}
+            for i, title in enumerate(params.get('titles', '').split('|')):
+                entity = self.store.entities.get(title.split(':')[-1])
+                if entity is None:
+                    pages[str(-1 - i)] = { 'title': title, 'missing': '' }
+                else:
+                    pages[title] = { 'title': title, 'lastrevid': entity['lastrevid'] }
+            return { 'query': { 'pages': pages } }
+        return { 'query': {} }
+
+    def _action_login(self, params: dict) -> dict:
+        return { 'login': { 'result': 'Success', 'lguserid': 1, 'lgusername': params.get('lgname', 'MockBot') } }
+
+    def _action_logout(self, params: dict) -> dict:
+        return {}
+
+    def _action_wbsearchentities(self, params: dict) -> dict:
+        ids = self.store.search(params.get('search', ''), params.get('language', 'en'))
+        offset = int(params.get('continue', 0))
+        limit = int(params.get('limit', 7))
+        result = { 'search': [{ 'id': entity_id, 'title': entity_id } for entity_id in ids[offset:offset + limit]],
+                   'success': 1 }
+        if offset + limit < len(ids):
+            result['search-continue'] = offset + limit
+        return result
+
+    def _action_wbgetentities(self, params: dict) -> dict:
+        entities = {}
+        for entity_id in params.get('ids', '').split('|'):
+            entity = self.store.entities.get(entity_id)
+            if entity is None:
+                entities[entity_id] = { 'id': entity_id, 'missing': '' }
+            else:
+                entities[entity_id] = _project_entity(entity, params.get('props'), params.get('languages'))
+        return { 'entities': entities, 'success': 1 }
+
+    def _action_wbeditentity(self, params: dict) -> dict:
+        data = json.loads(params.get('data', '{}'))
+        entity_id = params.get('id')
+        if entity_id is not None and entity_id not in self.store.entities:
+            return { 'error': { 'code': 'no-such-entity', 'info': 'Could not find an entity with the ID ' + entity_id } }
+        if entity_id is not None and params.get('clear'):
+            self.store.entities[entity_id]['claims'] = {}
+        return { 'entity': self.store.add_entity(data, entity_id), 'success': 1 }
+
+
+def start_server(host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 store: Optional[MockWikibaseStore] = None) -> ThreadingHTTPServer:
+    """
+    Starts the mock server in a background thread
+    Args:
+        host (str): address to listen on
+        port (int): port to listen on (0 for any free port)
+        latency (float): delay (in seconds) added to every API and SPARQL call
+        store (Optional[MockWikibaseStore]): store of items (new empty store by default)
+    Returns:
+        ThreadingHTTPServer: running server (its 'store' attribute holds the data and call counters)
+    """
+    handler = type('Handler', (MockWikibaseHandler,), { 'store': store or MockWikibaseStore(), 'latency': latency })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.store = handler.store
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs local stand-in of Wikibase API and SPARQL endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8181)
+    parser.add_argument('--latency', type=float, default=0.0, help='delay added to every call (seconds)')
+    args = parser.parse_args()
+    server = start_server(args.host, args.port, args.latency)
+    print('Mock Wikibase running at http://' + args.host + ':' + str(server.server_port) + API_PATH)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
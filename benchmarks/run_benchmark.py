@@ -0,0 +1,113 @@
+import argparse
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_wikibase import API_PATH, SPARQL_PATH, start_server
+
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DATA_PATH = os.path.join(REPOSITORY_PATH, 'data', 'persons.xml')
+
+
+def generate_persons(source_path: str, count: int, output_path: str):
+    """
+    Writes synthetic xml file with given number of persons, cloned from the source file; every clone gets
+    unique location (so that labels differ), while names, coats of arms and offices repeat like in real data
+    Args:
+        source_path (str): xml file with persons data used as a template
+        count (int): number of persons to generate
+        output_path (str): path of the generated file
+    """
+    templates = list(ET.parse(source_path).getroot())
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        output_file.write('<?xml version="1.0" ?>\n<persons>\n')
+        for i in range(count):
+            person = copy.deepcopy(templates[i % len(templates)])
+            location = person.find('location')
+            if location is None:
+                location = ET.SubElement(person, 'location')
+            location.text = 'z Miejsca ' + str(i)
+            output_file.write(ET.tostring(person, encoding='unicode'))
+        output_file.write('</persons>\n')
+
+
+def run_import(data_file_path: str, latency: float, import_args: list) -> dict:
+    """
+    Runs persons_import.py against fresh mock Wikibase server and measures it
+    Args:
+        data_file_path (str): xml file with persons data
+        latency (float): delay (in seconds) added by the server to every call
+        import_args (list): additional arguments of persons_import.py
+    Returns:
+        dict: wall time, persons per second, API calls (total and per person, by action),
+        bytes sent by the server and peak memory of the import process
+    """
+    server = start_server(latency=latency)
+    base_url = 'http://127.0.0.1:' + str(server.server_port)
+    persons_count = sum(1 for _, element in ET.iterparse(data_file_path) if element.tag == 'person')
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, WIKIBASE_URL=base_url, MEDIAWIKI_API_URL=base_url + API_PATH,
+                   SPARQL_ENDPOINT_URL=base_url + SPARQL_PATH, BOT_NAME='MockBot', BOT_PASSWORD='mock',
+                   LOOKUP_CACHE_PATH=os.path.join(work_dir, 'lookup_cache.sqlite'),
+                   ENTITY_CACHE_PATH=os.path.join(work_dir, 'entity_cache.sqlite'),
+                   READ_RATE='1000', WRITE_RATE='1000', MAX_READ_RATE='1000', MAX_WRITE_RATE='1000')
+        command = [sys.executable, os.path.join(REPOSITORY_PATH, 'persons_import.py'), data_file_path,
+                   '--journal', os.path.join(work_dir, 'journal.jsonl'),
+                   '--dead-letter', os.path.join(work_dir, 'failed_persons.jsonl')] + import_args
+        start_time = time.perf_counter()
+        process = subprocess.Popen(command, cwd=REPOSITORY_PATH, env=env, stdout=subprocess.DEVNULL)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start_time
+    server.shutdown()
+    calls = dict(server.store.calls)
+    return {
+        'data_file': os.path.basename(data_file_path),
+        'persons': persons_count,
+        'exit_status': os.waitstatus_to_exitcode(status),
+        'wall_time_s': round(wall_time, 3),
+        'persons_per_s': round(persons_count / wall_time, 2) if wall_time else 0,
+        'api_calls': calls,
+        'api_calls_per_person': { action: round(count / persons_count, 3) for action, count in calls.items() },
+        'bytes_sent': server.store.bytes_sent,
+        'peak_memory_mb': round(rusage.ru_maxrss / 1024, 1),
+    }
+
+
+def print_report(result: dict):
+    print('\n' + result['data_file'], '-', result['persons'], 'persons, exit status', result['exit_status'])
+    print('  wall time:', result['wall_time_s'], 's,', result['persons_per_s'], 'persons/s')
+    print('  peak memory:', result['peak_memory_mb'], 'MB, bytes received:', result['bytes_sent'])
+    for action, per_person in sorted(result['api_calls_per_person'].items()):
+        print('  ', action.ljust(20), str(result['api_calls'][action]).rjust(8), 'calls,', per_person, 'per person')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks persons_import.py against local mock Wikibase')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000],
+                        help='numbers of persons in synthetic inputs (data/persons.xml is always included)')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay added to every call (seconds)')
+    parser.add_argument('--json', help='path of the JSON file with results')
+    parser.add_argument('import_args', nargs=argparse.REMAINDER, help='arguments passed to persons_import.py (after --)')
+    args = parser.parse_args()
+    import_args = [arg for arg in args.import_args if arg != '--']
+
+    results = [run_import(SOURCE_DATA_PATH, args.latency, import_args)]
+    print_report(results[-1])
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in args.sizes:
+            data_file_path = os.path.join(data_dir, 'persons_' + str(size) + '.xml')
+            generate_persons(SOURCE_DATA_PATH, size, data_file_path)
+            results.append(run_import(data_file_path, args.latency, import_args))
+            print_report(results[-1])
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
@@ -1,92 +1,609 @@
-from dotenv import load_dotenv
-from wikibaseintegrator import WikibaseIntegrator, wbi_login
-from wikibaseintegrator.wbi_config import config as wbi_config
+from wikibaseintegrator import entities
 
-import os
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import threading
+import time
 
+from tools.dump_writer import DumpWriter
+from tools.import_journal import ImportJournal, DEFAULT_JOURNAL_PATH, get_person_key
+from tools import async_wb_actions, dead_letter, deduplicator, session, sharded_import, write_behind
+from tools.metrics import metrics
+import tools.dates_formatter as dates_formatter
+import tools.item_sync as item_sync
 import tools.properties_actions as properties
+import tools.vocabulary_resolver as vocabulary_resolver
 import tools.wb_actions as wb_actions
 import tools.xml_parser as xml_parser
 
 
-wbi_config['MEDIAWIKI_API_URL'] = 'https://prunus-208.man.poznan.pl/api.php'
-wbi_config['SPARQL_ENDPOINT_URL'] = 'https://prunus-208.man.poznan.pl/bigdata/sparql'
-wbi_config['WIKIBASE_URL'] = 'https://prunus-208.man.poznan.pl'
+parser = argparse.ArgumentParser(description='Imports persons from XML file into Wikibase')
+parser.add_argument('data_file_path', nargs='?', default='data/persons.xml', 
+                    help='XML file with persons data (may be gzip-compressed)')
+parser.add_argument('--start', type=int, default=0, help='number of persons to skip from the beginning of the file')
+parser.add_argument('--refresh-cache', action='store_true', help='ignore cached lookup results and entities and fetch them again')
+parser.add_argument('--preresolve', action='store_true', 
+                    help='resolve all vocabulary values (names, coats of arms, offices, places) before the import')
+parser.add_argument('--deduplicate', choices=['report', 'merge'], 
+                    help='find persons which repeat in the input or already exist in Wikibase (blocking on names, '
+                         'coat of arms and years of life) and report them, or also import them into existing items')
+parser.add_argument('--duplicates-out', default='duplicates.jsonl', help='output file of the duplicates report (JSON Lines)')
+parser.add_argument('--workers', type=int, default=1, help='number of persons imported in parallel')
+parser.add_argument('--async', dest='use_async', action='store_true', 
+                    help='import persons on one event loop with asynchronous API calls')
+parser.add_argument('--concurrency', type=int, default=50, help='number of persons imported at once in asynchronous mode')
+parser.add_argument('--write-behind', action='store_true', 
+                    help='read persons, build their items and write them in overlapping stages')
+parser.add_argument('--queue-size', type=int, default=write_behind.DEFAULT_QUEUE_SIZE, 
+                    help='maximal number of persons waiting in each queue of the write-behind pipeline')
+parser.add_argument('--processes', type=int, default=1, 
+                    help='number of processes (shards) importing persons, each with its own login to Wikibase')
+parser.add_argument('--sync', action='store_true', 
+                    help='compare existing persons with xml and write only added, changed and removed statements')
+parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH, help='path of the import journal')
+parser.add_argument('--resume', action='store_true', help='skip persons which were completely imported in previous runs')
+parser.add_argument('--dry-run', action='store_true', 
+                    help='do not connect to Wikibase, write entity JSON of persons to the output file instead')
+parser.add_argument('--out', default='persons.jsonl', help='output file of the dry run (JSON Lines)')
+parser.add_argument('--export-dump', 
+                    help='write new persons and vocabulary items to this Wikibase JSON dump (gzip-compressed '
+                         'if it ends with .gz) instead of Wikibase, for loading it on the server')
+parser.add_argument('--first-id', type=int, 
+                    help='first number of the range of item IDs reserved for the dump (above the highest existing ID)')
+parser.add_argument('--dead-letter', default=dead_letter.DEFAULT_DEAD_LETTER_PATH, 
+                    help='file of persons whose import failed, with errors and xml fragments (JSON Lines)')
+parser.add_argument('--retry-failed', action='store_true', 
+                    help='import again only persons from the dead-letter file of the previous run')
+parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='logging level')
+parser.add_argument('--metrics-json', help='path of the JSON file with metrics of API calls and persons')
+parser.add_argument('--metrics-prometheus', help='path of the Prometheus text file with metrics')
+args = parser.parse_args()
+if args.processes > 1 and args.dry_run:
+    parser.error('--processes cannot be combined with --dry-run')
+if args.use_async and (args.dry_run or args.processes > 1 or args.write_behind or args.sync):
+    parser.error('--async cannot be combined with --dry-run, --processes, --write-behind or --sync')
+if args.sync and args.dry_run:
+    parser.error('--sync cannot be combined with --dry-run')
+if args.export_dump and (args.dry_run or args.processes > 1 or args.use_async or args.sync):
+    parser.error('--export-dump cannot be combined with --dry-run, --processes, --async or --sync')
+if args.export_dump and args.first_id is None:
+    parser.error('--export-dump requires --first-id')
 
-load_dotenv()
-BOT_NAME = os.environ.get('BOT_NAME')
-BOT_PASSWORD = os.environ.get('BOT_PASSWORD')
+log_format = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+if args.processes > 1:
+    log_format = '%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s'
+logging.basicConfig(level=args.log_level, format=log_format)
+logger = logging.getLogger('persons_import')
 
-login_instance = wbi_login.Login(user=BOT_NAME, password=BOT_PASSWORD)
-wbi = WikibaseIntegrator(login=login_instance)
+if args.dry_run:
+    wb_actions.enable_offline_mode()
+    dry_run_file = open(args.out, 'w', encoding='utf-8')
+    dry_run_lock = threading.Lock()
 
-data_file_path = 'data/persons.xml'
+if args.export_dump:
+    if wb_actions.check_if_item_exists_by_ID('Q' + str(args.first_id)):
+        parser.error(f'item Q{args.first_id} already exists, --first-id must be above the highest existing ID')
+    dump_writer = DumpWriter(args.export_dump)
+    wb_actions.enable_export_mode(dump_writer, args.first_id)
+
+if args.refresh_cache:
+    wb_actions.lookup_cache.refresh = True
+    wb_actions.entity_cache.refresh = True
+wb_actions.lookup_cache.evict_expired()
+if not args.dry_run:
+    unchanged_count, removed_count = wb_actions.revalidate_entity_cache()
+    if unchanged_count or removed_count:
+        logger.info('Entity cache revalidated: %d entities unchanged, %d changed or deleted', unchanged_count, removed_count)
+
+journal = ImportJournal(args.journal)
+
+data_file_path = args.data_file_path
 # data_file_path = 'data/test.xml'
-data_file = ET.parse(data_file_path)
 
-for person in data_file.getroot():
-    label, description = xml_parser.get_label_and_description(person)
-    print('\n------------------------------------------------------------------------')
-    print('Label', label, '\nDescription', description)
-    
-    added_item = wb_actions.add_new_item(label, description, description)
-    item_id = added_item.id
-    
+failed_fragments = dead_letter.read_failed_fragments(args.dead_letter) if args.retry_failed else []
+if args.retry_failed:
+    logger.info('Retrying %d persons which failed in the previous run', len(failed_fragments))
+
+
+def iter_input_persons(shard: int = 0, shards: int = 1, keep_xml: bool = False, 
+                       on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[xml_parser.Person]:
+    """
+    Reads persons of the data file, or only persons which failed in the previous run (see --retry-failed)
+    Args:
+        shard (int): number of the shard to be read
+        shards (int): number of all shards
+        keep_xml (bool): if True, records keep the xml fragments of persons
+        on_error (Optional[Callable[[str, Exception], None]]): called for persons which cannot be parsed
+        (they are skipped), if not given the error is raised
+    Returns:
+        Iterator[xml_parser.Person]: records with data about persons
+    """
+    if args.retry_failed:
+        return dead_letter.iter_failed_persons(failed_fragments, shard, shards, on_error)
+    return xml_parser.iter_person_records(data_file_path, args.start, shard, shards, keep_xml, on_error)
+
+
+def skip_person(xml: str, error: Exception):
+    # persons which cannot be parsed are skipped before the import and written to the dead-letter file during it
+    pass
+
+
+if args.preresolve and not args.dry_run:
+    vocabulary = vocabulary_resolver.collect_vocabulary(iter_input_persons(on_error=skip_person))
+    # all dates of the file are normalised in the same pass, later persons use the memoised values
+    dates = dates_formatter.normalise_dates(vocabulary.pop('dates'))
+    logger.info('Normalised %d distinct dates, %d not recognized', len(dates), sum(not value.time for value in dates.values()))
+    resolved_count = vocabulary_resolver.preresolve_vocabulary(vocabulary)
+    logger.info('Pre-resolved %d of %d vocabulary values', resolved_count, sum(len(values) for values in vocabulary.values()))
+    created_count = vocabulary_resolver.create_missing_vocabulary(vocabulary)
+    logger.info('Created %d missing vocabulary items', created_count)
+
+
+if args.deduplicate:
+    existing_persons = []
+    if not args.dry_run:
+        try:
+            existing_persons = list(deduplicator.iter_existing_persons())
+        except Exception as e:
+            logger.warning('Reading existing persons failed (%s), only duplicates in the input are reported', e)
+    duplicates = deduplicator.find_duplicates(iter_input_persons(on_error=skip_person), existing_persons)
+    with open(args.duplicates_out, 'w', encoding='utf-8') as duplicates_file:
+        for duplicate in duplicates:
+            duplicates_file.write(json.dumps(duplicate, ensure_ascii=False) + '\n')
+    existing_count = sum('item_id' in duplicate for duplicate in duplicates)
+    logger.info('Found %d persons existing in Wikibase and %d repeated in the input (of %d existing persons), '
+                'written to %s', existing_count, len(duplicates) - existing_count, len(existing_persons), args.duplicates_out)
+    if args.deduplicate == 'merge':
+        logger.info('%d persons will be imported into existing items', deduplicator.merge_duplicates(duplicates))
+
+def import_person(person: xml_parser.Person) -> str:
+    """
+    Adds (or updates) the item of one person with all its properties; if it fails, the person is written
+    to the dead-letter file
+    Args:
+        person (xml_parser.Person): record with all data about one person
+    Returns:
+        str: ID of the person item (empty if the import failed)
+    """
+    person_start_time = time.perf_counter()
+    try:
+        item_id = _import_person(person)
+    except Exception as e:
+        dead_letters.add(person.xml, e, person)
+        return ''
+    finally:
+        metrics.record_person(time.perf_counter() - person_start_time)
+    dead_letters.add_success()
+    return item_id
+
+
+def add_person_properties(added_item: entities.item.ItemEntity, person: xml_parser.Person):
+    """
+    Adds all properties (and aliases) of the person to the item
+    Args:
+        added_item (entities.item.ItemEntity): item entity of the person
+        person (xml_parser.Person): record with all data about one person
+    """
     properties.add_human(added_item)
                
-    name = person.find('name')
-    if name is not None:
-        for single_name in name.text.split():
+    if person.name is not None:
+        for single_name in person.name.split():
             properties.add_given_name(added_item, single_name)
     
-    surname = person.find('surname')
-    if surname is not None:
-        properties.add_family_name(added_item, surname.text)
+    if person.surname is not None:
+        properties.add_family_name(added_item, person.surname)
   
-    location = person.find('location')
-    if location is not None:
-        properties.add_location_as_string(added_item, location.text)
+    if person.location is not None:
+        properties.add_location_as_string(added_item, person.location)
          
-    coat_of_arms = person.find('coat_of_arms')
-    if coat_of_arms is not None and 'nieznany' not in coat_of_arms.text:    
-        properties.add_coat_of_arms(added_item, coat_of_arms.text)
+    if person.coat_of_arms is not None and 'nieznany' not in person.coat_of_arms:    
+        properties.add_coat_of_arms(added_item, person.coat_of_arms)
                 
-    date_of_birth = person.find('date_of_birth') 
-    if date_of_birth is not None:
-        properties.add_date_of_birth(added_item, date_of_birth.text)       
+    if person.date_of_birth is not None:
+        properties.add_date_of_birth(added_item, person.date_of_birth)       
         
-    date_of_death = person.find('date_of_death')
-    if date_of_death is not None:
-        properties.add_date_of_death(added_item, date_of_death.text) 
+    if person.date_of_death is not None:
+        properties.add_date_of_death(added_item, person.date_of_death) 
         
-    floruit = person.find('floruit')
-    if floruit is not None:
-        properties.add_floruit(added_item, floruit.text)  
+    if person.floruit is not None:
+        properties.add_floruit(added_item, person.floruit)  
     
-    place_of_birth = person.find('place_of_birth')
-    if place_of_birth is not None:
-        place_of_birth_name = place_of_birth.find('place').text
-        place_of_birth_prng = place_of_birth.find('prng').text
-        properties.add_birth_place(added_item, place_of_birth_name, place_of_birth_prng)
-
-    stated_as_list = person.findall('stated_as')
-    for stated_as in stated_as_list:
-        language = stated_as.attrib['lang']
-        properties.add_stated_as(added_item, stated_as.text, language)
-        properties.add_alias(added_item, stated_as.text, language)
+    if person.place_of_birth is not None and person.place_of_birth_prng is not None:
+        properties.add_birth_place(added_item, person.place_of_birth, person.place_of_birth_prng)
+
+    for stated_as, language in person.stated_as:
+        properties.add_stated_as(added_item, stated_as, language)
+        properties.add_alias(added_item, stated_as, language)
     
-    # TODO urzędy dodają się ponownie chociaż już istnieją
-    positions_list = person.find('positions')
-    for position in positions_list:
-        office, start_date, end_date, date = xml_parser.get_office_details(position)
-        properties.add_position_held(added_item, office, start_date, end_date, date)
+    for position in person.positions:
+        properties.add_position_held(added_item, position.office, position.start_date, position.end_date, position.date)
     
-    bibliography = person.find('bibliography')   
-    if bibliography is not None:
-        title, pages = xml_parser.get_source_title_and_pages(bibliography)
+    if person.bibliography:
+        title, pages = xml_parser.get_source_title_and_pages(person.bibliography[0])
         properties.add_described_by_source(added_item, title, pages)
+
+
+def get_person_lock(person: xml_parser.Person) -> threading.RLock:
+    """
+    Returns:
+        threading.RLock: lock of the person's label and description (see wb_actions.add_new_item), held
+        from the lookup of the person until its item is written, so that repeats of the person imported 
+        by other workers wait and find the written item
+    """
+    label, description = xml_parser.get_label_and_description(person)
+    return wb_actions.get_key_lock((label, 'description', description))
+
+
+def add_person_data(added_item: entities.item.ItemEntity, person: xml_parser.Person) -> bool:
+    """
+    Adds all properties of the person to the item; if the item already exists, statements identical 
+    to the existing ones are dropped
+    Args:
+        added_item (entities.item.ItemEntity): new or existing item entity of the person
+        person (xml_parser.Person): record with all data about one person
+    Returns:
+        bool: False if the existing item already has all the data (nothing has to be written)
+    """
+    existing_signature = wb_actions.get_content_signature(added_item) if added_item.id else None
+    add_person_properties(added_item, person)
+    if existing_signature is None:
+        return True
+    removed_count = wb_actions.remove_existing_statements(added_item)
+    logger.debug('Skipped %d statements which already exist', removed_count)
+    return wb_actions.get_content_signature(added_item) != existing_signature
+
+
+def _import_person(person: xml_parser.Person) -> str:
+    with get_person_lock(person):
+        person_key, item_id, added_item = prepare_person(person)
+        if added_item is None:
+            return item_id
+        return finish_person(person_key, added_item)
+
+
+def prepare_person(person: xml_parser.Person) -> Tuple[str, str, Optional[entities.item.ItemEntity]]:
+    """
+    Builds the item of the person with all its properties (vocabulary items are looked up and created 
+    if needed), without writing it; in sync mode the item contains only changes of the existing item
+    Args:
+        person (xml_parser.Person): record with all data about one person
+    Returns:
+        Tuple[str, str, Optional[entities.item.ItemEntity]]: key of the person in the journal, ID of the existing
+        item and item entity to be written (None if the person was already imported, see --resume, or if
+        the existing item has no changes, see --sync)
+    """
+    label, description = xml_parser.get_label_and_description(person)
+    logger.info('Importing person %s (%s)', label, description)
+    
+    person_key = get_person_key(label, description)
+    if args.resume and journal.is_complete(person_key):
+        logger.info('Person was already imported, ID = %s', journal.get_item_id(person_key))
+        return person_key, journal.get_item_id(person_key), None
+    
+    added_item = wb_actions.add_new_item(label, description, description, write=False)
+    if args.export_dump and added_item.id:
+        if wb_actions.is_placeholder_id(added_item.id):
+            logger.warning('Person repeats in the input, it was already exported with ID = %s', added_item.id)
+        else:
+            logger.warning('Person already exists in Wikibase (ID = %s), it is not exported', added_item.id)
+        return person_key, added_item.id, None
+    if args.sync and added_item.id:
+        new_item = wb_actions.new_item_entity()
+        add_person_properties(new_item, person)
+        changes = item_sync.get_changes(added_item, new_item, properties.SYNCED_PROPERTIES)
+        if changes.item is None:
+            logger.info('Person has no changes, ID = %s', added_item.id)
+        else:
+            logger.info('Person changed: %d statements added, %d changed, %d removed', 
+                        changes.added, changes.changed, changes.removed)
+        return person_key, added_item.id, changes.item
+    
+    if not add_person_data(added_item, person):
+        logger.info('Person has no new data, ID = %s', added_item.id)
+        if not args.dry_run:
+            journal.record(person_key, added_item.id, wb_actions.get_statement_signatures(added_item))
+        return person_key, added_item.id, None
+    
+    return person_key, added_item.id or '', added_item
+
+
+def finish_person(person_key: str, added_item: entities.item.ItemEntity) -> str:
+    """
+    Writes the prepared item of the person (or its JSON in the dry run, or the item to the dump in export mode) 
+    and records it in the journal
+    Args:
+        person_key (str): key of the person in the journal
+        added_item (entities.item.ItemEntity): prepared item entity (see prepare_person)
+    Returns:
+        str: ID of the person item
+    """
+    if args.dry_run:
+        with dry_run_lock:
+            dry_run_file.write(json.dumps(added_item.get_json(), ensure_ascii=False) + '\n')
+        return added_item.id or ''
     
-    # added_item.write()
+    written_item = wb_actions.write_item(added_item)
+    if not args.export_dump:
+        journal.record(person_key, written_item.id, wb_actions.get_statement_signatures(written_item))
     
-    
\ No newline at end of file
+    return written_item.id
+
+
+async def async_import_person(client: async_wb_actions.AsyncWikibaseClient, person: xml_parser.Person) -> str:
+    """
+    Adds (or updates) the item of one person using asynchronous API calls: all vocabulary lookups of the person
+    are sent at once, then the statements are built and the item is written; if it fails, the person is written
+    to the dead-letter file
+    Args:
+        client (async_wb_actions.AsyncWikibaseClient): API client
+        person (xml_parser.Person): record with all data about one person
+    Returns:
+        str: ID of the person item (empty if the import failed)
+    """
+    person_start_time = time.perf_counter()
+    try:
+        item_id = await _async_import_person(client, person)
+    except Exception as e:
+        dead_letters.add(person.xml, e, person)
+        return ''
+    finally:
+        metrics.record_person(time.perf_counter() - person_start_time)
+    dead_letters.add_success()
+    return item_id
+
+
+async def _async_import_person(client: async_wb_actions.AsyncWikibaseClient, person: xml_parser.Person) -> str:
+    label, description = xml_parser.get_label_and_description(person)
+    logger.info('Importing person %s (%s)', label, description)
+    
+    person_key = get_person_key(label, description)
+    if args.resume and journal.is_complete(person_key):
+        logger.info('Person was already imported, ID = %s', journal.get_item_id(person_key))
+        return journal.get_item_id(person_key)
+    
+    await async_wb_actions.async_resolve_vocabulary(client, vocabulary_resolver.collect_vocabulary([person]))
+    # held until the item is written and registered, so that repeats of the person wait and find it
+    async with async_wb_actions.get_key_lock(('person', person_key)):
+        added_item = await async_wb_actions.async_add_new_item(client, label, description, description, write=False)
+        if not add_person_data(added_item, person):
+            logger.info('Person has no new data, ID = %s', added_item.id)
+            journal.record(person_key, added_item.id, wb_actions.get_statement_signatures(added_item))
+            return added_item.id
+        
+        written_item = await async_wb_actions.async_write_item(client, added_item)
+    journal.record(person_key, written_item.id, wb_actions.get_statement_signatures(written_item))
+    
+    return written_item.id
+
+
+async def import_persons_async(persons: Iterable[xml_parser.Person], concurrency: int) -> int:
+    """
+    Imports persons on one event loop, keeping at most given number of persons in progress
+    Args:
+        persons (Iterable[xml_parser.Person]): records with all data about persons
+        concurrency (int): maximal number of persons in progress
+    Returns:
+        int: number of imported persons
+    """
+    persons_count = 0
+    async with async_wb_actions.AsyncWikibaseClient() as client:
+        in_progress = set()
+        for person in persons:
+            in_progress.add(asyncio.ensure_future(async_import_person(client, person)))
+            if len(in_progress) >= concurrency:
+                finished, in_progress = await asyncio.wait(in_progress, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    task.result()
+                persons_count += len(finished)
+        if in_progress:
+            finished, _ = await asyncio.wait(in_progress)
+            for task in finished:
+                task.result()
+            persons_count += len(finished)
+    return persons_count
+
+
+def import_persons_concurrently(persons: Iterable[xml_parser.Person], workers: int,
+                                import_function: Callable[[xml_parser.Person], str] = import_person
+                                ) -> Iterator[Tuple[xml_parser.Person, str]]:
+    """
+    Imports persons in parallel, keeping at most twice as many persons in progress as there are workers
+    Args:
+        persons (Iterable[xml_parser.Person]): records with all data about persons
+        workers (int): number of parallel workers
+        import_function (Callable[[xml_parser.Person], str]): function importing one person
+    Returns:
+        Iterator[Tuple[xml_parser.Person, str]]: persons with IDs of their items, in input order
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_progress = []
+        for person in persons:
+            in_progress.append((person, executor.submit(import_function, person)))
+            if len(in_progress) >= 2 * workers:
+                finished_person, future = in_progress.pop(0)
+                yield finished_person, future.result()
+        for finished_person, future in in_progress:
+            yield finished_person, future.result()
+
+
+stop_event = threading.Event()
+
+
+def request_stop(signum, frame):
+    """
+    Handles the first SIGINT by stopping reading of persons (persons in progress and pending writes
+    are finished), the next one aborts the import
+    """
+    if stop_event.is_set():
+        raise KeyboardInterrupt
+    logger.warning('Interrupted, finishing persons in progress and pending writes (press Ctrl+C again to abort)')
+    stop_event.set()
+
+
+def _write_prepared_person(entry: Tuple[xml_parser.Person, str, entities.item.ItemEntity, float]):
+    person, person_key, added_item, person_start_time = entry
+    try:
+        finish_person(person_key, added_item)
+    except Exception as e:
+        dead_letters.add(person.xml, e, person)
+    else:
+        dead_letters.add_success()
+    finally:
+        metrics.record_person(time.perf_counter() - person_start_time)
+
+
+def import_persons_write_behind(persons: Iterable[xml_parser.Person], workers: int) -> int:
+    """
+    Imports persons in overlapping stages connected with bounded queues: persons are read from xml
+    in a background thread, their items are built by given number of workers and written by a background 
+    writer; on SIGINT reading stops and all prepared items are written
+    Args:
+        persons (Iterable[xml_parser.Person]): records with all data about persons
+        workers (int): number of workers building the items
+    Returns:
+        int: number of imported persons
+    """
+    writer = write_behind.BackgroundWriter(_write_prepared_person, args.queue_size)
+
+    def stage_person(person: xml_parser.Person) -> str:
+        person_start_time = time.perf_counter()
+        try:
+            person_key = get_person_key(*xml_parser.get_label_and_description(person))
+        except Exception as e:
+            metrics.record_person(time.perf_counter() - person_start_time)
+            dead_letters.add(person.xml, e, person)
+            return ''
+        # a repeat of the person waits until the item of its previous occurrence is written
+        writer.reserve(person_key)
+        try:
+            person_key, item_id, added_item = prepare_person(person)
+        except dead_letter.TooManyFailuresError:
+            writer.release(person_key)
+            raise
+        except Exception as e:
+            writer.release(person_key)
+            metrics.record_person(time.perf_counter() - person_start_time)
+            dead_letters.add(person.xml, e, person)
+            return ''
+        if added_item is None:
+            writer.release(person_key)
+            metrics.record_person(time.perf_counter() - person_start_time)
+            dead_letters.add_success()
+            return item_id
+        writer.submit(person_key, (person, person_key, added_item, person_start_time))
+        return added_item.id or ''
+
+    persons = write_behind.prefetch(persons, args.queue_size, stop_event)
+    persons_count = 0
+    try:
+        if workers > 1:
+            for _ in import_persons_concurrently(persons, workers, stage_person):
+                persons_count += 1
+        else:
+            for person in persons:
+                stage_person(person)
+                persons_count += 1
+    finally:
+        writer.close()
+    return persons_count
+
+
+def import_persons(shard: int = 0, shards: int = 1) -> int:
+    """
+    Imports all persons of the data file (or of one shard of it, or only persons which failed in the previous run)
+    Args:
+        shard (int): number of the shard to be imported
+        shards (int): number of all shards
+    Returns:
+        int: number of imported persons
+    """
+    persons = iter_input_persons(shard, shards, keep_xml=True, on_error=dead_letters.add_unparsed)
+    if args.use_async:
+        return asyncio.run(import_persons_async(persons, args.concurrency))
+    if args.write_behind:
+        signal.signal(signal.SIGINT, request_stop)
+        return import_persons_write_behind(persons, args.workers)
+    persons_count = 0
+    if args.workers > 1:
+        for person, item_id in import_persons_concurrently(persons, args.workers):
+            logger.info('Person %s imported, ID = %s', xml_parser.get_label_and_description(person)[0], item_id)
+            persons_count += 1
+    else:
+        for person in persons:
+            import_person(person)
+            persons_count += 1
+    return persons_count
+
+
+# the dead-letter file of the previous run is replaced only when the import ends; persons failing in
+# the dry run are written next to its output, so that they do not replace the persons to be retried
+dead_letters = dead_letter.DeadLetterFile(args.out + '.failed.jsonl' if args.dry_run else args.dead_letter)
+import_completed = False
+start_time = time.perf_counter()
+try:
+    if args.processes > 1:
+        shard_results = sharded_import.run_shards(args.processes, import_persons)
+        for shard_result in shard_results:
+            logger.info('Shard %d: %d persons imported%s', shard_result['shard'], shard_result['persons'],
+                        ' (failed)' if shard_result['error'] else '')
+        persons_count = sum(shard_result['persons'] for shard_result in shard_results)
+        import_completed = not any(shard_result['error'] for shard_result in shard_results)
+    else:
+        persons_count = import_persons()
+        import_completed = not stop_event.is_set()
+finally:
+    # an interrupted retry keeps the previous dead-letter file, which still contains the persons not reached
+    keep_previous = args.retry_failed and not import_completed
+    dead_letters.close(replace=not keep_previous)
+    if keep_previous:
+        logger.warning('Retry was interrupted, %s was not changed', dead_letters.path)
+elapsed_time = time.perf_counter() - start_time
+persons_per_second = persons_count / elapsed_time if elapsed_time else 0
+logger.info('Imported %d persons in %.2f s, %.2f persons/s', persons_count, elapsed_time, persons_per_second)
+
+if args.dry_run:
+    dry_run_file.close()
+    vocabulary_file_path = args.out + '.vocabulary.jsonl'
+    with open(vocabulary_file_path, 'w', encoding='utf-8') as vocabulary_file:
+        for planned_item in wb_actions.planned_items:
+            vocabulary_file.write(json.dumps(planned_item, ensure_ascii=False) + '\n')
+    logger.info('Entities written to %s, %d vocabulary items to be created written to %s', 
+                args.out, len(wb_actions.planned_items), vocabulary_file_path)
+
+if args.export_dump:
+    dump_writer.close()
+    logger.info('%d items (Q%d - Q%d) written to the dump %s', dump_writer.count, args.first_id, 
+                args.first_id + dump_writer.count - 1, args.export_dump)
+
+failed_count = len(dead_letter.read_failed_fragments(dead_letters.path))
+if failed_count:
+    logger.warning('%d persons failed, written to %s (import them again with --retry-failed)', failed_count, dead_letters.path)
+
+if args.processes > 1:
+    for shard_result in shard_results:
+        if shard_result['rates']:
+            logger.info('Request rates of shard %d: reads = %.2f/s, writes = %.2f/s', shard_result['shard'],
+                        shard_result['rates']['read'], shard_result['rates']['write'])
+    cache_hits = sum(shard_result['cache_hits'] for shard_result in shard_results)
+    cache_misses = sum(shard_result['cache_misses'] for shard_result in shard_results)
+    entity_cache_hits = sum(shard_result['entity_cache_hits'] for shard_result in shard_results)
+    entity_cache_misses = sum(shard_result['entity_cache_misses'] for shard_result in shard_results)
+else:
+    rates = session.get_rates()
+    logger.info('Request rates: reads = %.2f/s, writes = %.2f/s', rates['read'], rates['write'])
+    cache_hits, cache_misses = wb_actions.lookup_cache.get_stats()
+    entity_cache_hits, entity_cache_misses = wb_actions.entity_cache.get_stats()
+logger.info('Lookup cache: hits = %d, misses = %d', cache_hits, cache_misses)
+logger.info('Entity cache: hits = %d, misses = %d', entity_cache_hits, entity_cache_misses)
+
+summary = metrics.get_summary()
+logger.info('API calls: %d (%.2f per person)', summary['api_calls'], summary['api_calls_per_person'])
+if args.metrics_json:
+    metrics.write_json(args.metrics_json)
+if args.metrics_prometheus:
+    metrics.write_prometheus(args.metrics_prometheus)
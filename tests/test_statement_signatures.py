@@ -0,0 +1,62 @@
+from wikibaseintegrator.datatypes import Item
+from wikibaseintegrator.models.claims import Claim
+
+import json
+import os
+import tempfile
+import unittest
+
+# caches of wb_actions are created on import, keep them out of the working directory
+_cache_directory = tempfile.mkdtemp()
+os.environ.setdefault('LOOKUP_CACHE_PATH', os.path.join(_cache_directory, 'lookup_cache.sqlite'))
+os.environ.setdefault('ENTITY_CACHE_PATH', os.path.join(_cache_directory, 'entity_cache.sqlite'))
+
+import tools.wb_actions as wb_actions
+
+
+def get_claim(value: dict, qualifier_value: dict = None) -> Claim:
+    claim_json = { 'mainsnak': { 'snaktype': 'value', 'property': 'P55', 'hash': '',
+                                 'datavalue': { 'value': value, 'type': 'wikibase-entityid' },
+                                 'datatype': 'wikibase-item' },
+                   'type': 'statement', 'rank': 'normal', 'id': '' }
+    if qualifier_value is not None:
+        claim_json['qualifiers'] = { 'P189': [{ 'snaktype': 'value', 'property': 'P189', 'hash': '',
+                                                'datavalue': { 'value': qualifier_value, 'type': 'wikibase-entityid' },
+                                                'datatype': 'wikibase-item' }] }
+    return Claim().from_json(claim_json)
+
+
+class StatementSignatureTest(unittest.TestCase):
+
+    def test_numeric_id_as_string_and_integer(self):
+        integer_claim = get_claim({ 'entity-type': 'item', 'numeric-id': 42, 'id': 'Q42' })
+        string_claim = get_claim({ 'entity-type': 'item', 'numeric-id': '42', 'id': 'Q42' })
+        self.assertEqual(wb_actions.get_statement_signature(integer_claim), wb_actions.get_statement_signature(string_claim))
+
+    def test_numeric_id_without_id(self):
+        claim = get_claim({ 'entity-type': 'item', 'numeric-id': 42, 'id': 'Q42' })
+        claim_without_id = get_claim({ 'entity-type': 'item', 'numeric-id': '42' })
+        self.assertEqual(wb_actions.get_statement_signature(claim), wb_actions.get_statement_signature(claim_without_id))
+
+    def test_qualifier_numeric_id(self):
+        value = { 'entity-type': 'item', 'numeric-id': 42, 'id': 'Q42' }
+        integer_claim = get_claim(value, { 'entity-type': 'item', 'numeric-id': 37979, 'id': 'Q37979' })
+        string_claim = get_claim(value, { 'entity-type': 'item', 'numeric-id': '37979', 'id': 'Q37979' })
+        self.assertEqual(wb_actions.get_statement_signature(integer_claim), wb_actions.get_statement_signature(string_claim))
+
+    def test_different_items(self):
+        claim = get_claim({ 'entity-type': 'item', 'numeric-id': 42, 'id': 'Q42' })
+        other_claim = get_claim({ 'entity-type': 'item', 'numeric-id': '43', 'id': 'Q43' })
+        self.assertNotEqual(wb_actions.get_statement_signature(claim), wb_actions.get_statement_signature(other_claim))
+
+    def test_signature_of_built_statement_is_unchanged(self):
+        # statements built by wbi (and returned by the API) already have integer numeric IDs with entity IDs,
+        # so their signatures are the same as before the normalisation
+        claim = Item(value='Q42', prop_nr='P55')
+        mainsnak = claim.get_json()['mainsnak']
+        expected = json.dumps([[mainsnak['property'], mainsnak['snaktype'], mainsnak['datavalue']], []],
+                              sort_keys=True, ensure_ascii=False)
+        self.assertEqual(wb_actions.get_statement_signature(claim), expected)
+
+if __name__ == '__main__':
+    unittest.main()
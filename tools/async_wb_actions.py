@@ -0,0 +1,458 @@
+import aiohttp
+from wikibaseintegrator import entities
+from wikibaseintegrator.datatypes import BaseDataType, Item
+from wikibaseintegrator.wbi_config import config as wbi_config
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlencode
+
+from tools import exact_lookup, session, sparql
+from tools.metrics import metrics
+from tools.rate_limiter import WRITE_ACTIONS, get_api_error, get_throttle_delay
+from tools.vocabulary_resolver import CATEGORY_DESCRIPTIONS, CATEGORY_PROPERTIES
+import tools.wb_actions as wb_actions
+
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_POOL_SIZE = 32
+MAX_RETRIES = 5
+SEARCH_LIMIT = 50
+
+_key_locks: Dict[tuple, asyncio.Lock] = {}
+
+
+class AsyncApiError(Exception):
+    """
+    Error returned by MediaWiki API to the asynchronous client
+    """
+
+    def __init__(self, error: dict):
+        super().__init__(error.get('info') or error.get('code') or str(error))
+        self.code = error.get('code', '')
+        self.error = error
+
+
+class AsyncWikibaseClient:
+    """
+    Asynchronous client of MediaWiki API with a pool of keep-alive connections; requests go through
+    the same adaptive rate limiter as blocking calls (see session) and are repeated when the server
+    asks to slow down; the client logs in (bot credentials from BOT_NAME and BOT_PASSWORD) before the first edit
+    """
+
+    def __init__(self, mediawiki_api_url: Optional[str] = None, connections: int = CONNECTION_POOL_SIZE):
+        """
+        Args:
+            mediawiki_api_url (Optional[str]): URL of MediaWiki API (the configured one by default)
+            connections (int): maximal number of open connections
+        """
+        self.mediawiki_api_url = mediawiki_api_url or wbi_config['MEDIAWIKI_API_URL']
+        self.connections = connections
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.csrf_token: Optional[str] = None
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> 'AsyncWikibaseClient':
+        self.http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http_session.close()
+
+    async def call(self, data: dict, post: bool = False) -> dict:
+        """
+        Sends the request to MediaWiki API
+        Args:
+            data (dict): parameters of the request (format and maxlag are added)
+            post (bool): if True, the request is sent with POST method
+        Returns:
+            dict: decoded response
+        Raises:
+            AsyncApiError: if the API returned an error or kept asking to slow down
+        """
+        data = dict(data, format='json', maxlag=session.rate_limiter.maxlag)
+        action = data['action']
+        bucket = session.rate_limiter.get_bucket(action in WRITE_ACTIONS)
+        bytes_sent = len(urlencode(data).encode('utf-8')) if post else 0
+        for _ in range(MAX_RETRIES + 1):
+            await bucket.acquire_async()
+            start_time = time.perf_counter()
+            if post:
+                request = self.http_session.post(self.mediawiki_api_url, data=data)
+            else:
+                request = self.http_session.get(self.mediawiki_api_url, params=data)
+            async with request as response:
+                content = await response.read()
+                status = response.status
+                headers = response.headers
+            duration = time.perf_counter() - start_time
+            error = get_api_error(content, headers.get('Content-Type', ''))
+            delay = get_throttle_delay(status, headers, error)
+            if delay == 0:
+                bucket.on_success()
+            else:
+                bucket.on_throttle(delay if delay > 0 else session.rate_limiter.default_retry_after)
+            metrics.record_call(action, duration, bytes_sent, len(content), throttled=delay != 0,
+                                failed=delay == 0 and (status >= 400 or bool(error)))
+            if delay != 0:
+                continue
+            if error:
+                raise AsyncApiError(error)
+            if status >= 400:
+                raise AsyncApiError({ 'code': 'http-' + str(status) })
+            return json.loads(content)
+        raise AsyncApiError({ 'code': 'maxretries', 'info': 'Too many throttled attempts of ' + action })
+
+    async def login(self):
+        """
+        Logs in with bot credentials and fetches the edit (CSRF) token
+        """
+        result = await self.call({ 'action': 'query', 'meta': 'tokens', 'type': 'login' })
+        result = await self.call({ 'action': 'login', 'lgname': os.environ.get('BOT_NAME'),
+                                   'lgpassword': os.environ.get('BOT_PASSWORD'),
+                                   'lgtoken': result['query']['tokens']['logintoken'] }, post=True)
+        if result['login']['result'] != 'Success':
+            raise AsyncApiError({ 'code': 'login-' + result['login']['result'], 'info': result['login'].get('reason', '') })
+        result = await self.call({ 'action': 'query', 'meta': 'tokens' })
+        self.csrf_token = result['query']['tokens']['csrftoken']
+
+    async def get_edit_token(self) -> str:
+        async with self._login_lock:
+            if self.csrf_token is None:
+                await self.login()
+            return self.csrf_token
+
+    async def edit(self, data: dict) -> dict:
+        """
+        Sends the edit request with the edit token (fetched again after 'badtoken' error)
+        Args:
+            data (dict): parameters of the request
+        Returns:
+            dict: decoded response
+        """
+        token = await self.get_edit_token()
+        try:
+            return await self.call(dict(data, token=token), post=True)
+        except AsyncApiError as e:
+            if e.code != 'badtoken':
+                raise
+        async with self._login_lock:
+            if self.csrf_token == token:
+                self.csrf_token = (await self.call({ 'action': 'query', 'meta': 'tokens' }))['query']['tokens']['csrftoken']
+        return await self.call(dict(data, token=self.csrf_token), post=True)
+
+
+def get_key_lock(key: tuple) -> asyncio.Lock:
+    """
+    Returns the lock assigned to given key, so that only one task at a time looks up and creates
+    the item for the same key (see wb_actions.get_key_lock)
+    Args:
+        key (tuple): key identifying the item
+    Returns:
+        asyncio.Lock: lock for the key
+    """
+    lock = _key_locks.get(key)
+    if lock is None:
+        lock = _key_locks[key] = asyncio.Lock()
+    return lock
+
+
+async def async_search_entities(client: AsyncWikibaseClient, label: str, language: str = 'pl') -> List[str]:
+    """
+    Args:
+        client (AsyncWikibaseClient): API client
+        label (str): searched text
+        language (str): language of the search
+    Returns:
+        List[str]: IDs of found items
+    """
+    result = await client.call({ 'action': 'wbsearchentities', 'search': label, 'language': language, 'type': 'item',
+                                 'limit': SEARCH_LIMIT })
+    return [entity['id'] for entity in result.get('search', [])]
+
+
+async def async_revalidate_entity_cache(client: AsyncWikibaseClient, ids: Iterable[str]):
+    """
+    Checks revision IDs of entities cached in previous runs (see wb_actions.revalidate_entity_cache)
+    Args:
+        client (AsyncWikibaseClient): API client
+        ids (Iterable[str]): IDs of the entities to be checked
+    """
+    unchecked = wb_actions.entity_cache.get_unchecked(ids)
+    if not unchecked:
+        return
+    unchecked_ids = list(unchecked)
+    chunks = [unchecked_ids[i:i + wb_actions.BULK_CHUNK_SIZE] for i in range(0, len(unchecked_ids), wb_actions.BULK_CHUNK_SIZE)]
+    results = await asyncio.gather(*(client.call({ 'action': 'wbgetentities', 'props': 'info', 'ids': '|'.join(chunk) })
+                                     for chunk in chunks))
+    current_revisions = {}
+    for result in results:
+        for entity_id, entity_json in result.get('entities', {}).items():
+            if 'missing' not in entity_json:
+                current_revisions[entity_id] = int(entity_json['lastrevid'])
+    wb_actions.entity_cache.mark_checked(entity_id for entity_id, lastrevid in unchecked.items()
+                                         if current_revisions.get(entity_id) == lastrevid)
+    wb_actions.entity_cache.remove(entity_id for entity_id, lastrevid in unchecked.items()
+                                   if current_revisions.get(entity_id) != lastrevid)
+
+
+async def async_get_items_bulk(client: AsyncWikibaseClient, ids: List[str]) -> Dict[str, entities.item.ItemEntity]:
+    """
+    Gets items with given IDs from the entity cache and the remaining ones from Wikibase (chunks are fetched
+    concurrently, see wb_actions.get_items_bulk)
+    Args:
+        client (AsyncWikibaseClient): API client
+        ids (List[str]): IDs of the items
+    Returns:
+        Dict[str, entities.item.ItemEntity]: existing item entities by ID (missing items are omitted)
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    await async_revalidate_entity_cache(client, unique_ids)
+    items = {}
+    for entity_id in unique_ids:
+        entity_json = wb_actions.entity_cache.get(entity_id)
+        if entity_json is not None:
+            items[entity_id] = entities.item.ItemEntity().from_json(entity_json)
+    unique_ids = [entity_id for entity_id in unique_ids if entity_id not in items]
+    chunks = [unique_ids[i:i + wb_actions.BULK_CHUNK_SIZE] for i in range(0, len(unique_ids), wb_actions.BULK_CHUNK_SIZE)]
+    results = await asyncio.gather(*(client.call({ 'action': 'wbgetentities', 'ids': '|'.join(chunk) }) for chunk in chunks))
+    for result in results:
+        for entity_id, entity_json in result.get('entities', {}).items():
+            if 'missing' not in entity_json:
+                wb_actions.entity_cache.set(entity_json)
+                items[entity_id] = entities.item.ItemEntity().from_json(entity_json)
+    return items
+
+
+async def async_get_item_summaries(client: AsyncWikibaseClient, ids: List[str], 
+                                   props: Iterable[str] = ()) -> Dict[str, wb_actions.ItemSummary]:
+    """
+    Gets only Polish labels and descriptions (and values of given properties) of items with given IDs
+    (see wb_actions.get_item_summaries)
+    Args:
+        client (AsyncWikibaseClient): API client
+        ids (List[str]): IDs of the items
+        props (Iterable[str]): IDs of the properties whose values are needed
+    Returns:
+        Dict[str, wb_actions.ItemSummary]: summaries of existing items by ID (missing items are omitted)
+    """
+    props = list(props)
+    unique_ids = list(dict.fromkeys(ids))
+    chunks = [unique_ids[i:i + wb_actions.BULK_CHUNK_SIZE] for i in range(0, len(unique_ids), wb_actions.BULK_CHUNK_SIZE)]
+    params = wb_actions.get_summary_params(props)
+    results = await asyncio.gather(*(client.call(dict(params, action='wbgetentities', ids='|'.join(chunk)))
+                                     for chunk in chunks))
+    summaries = {}
+    for result in results:
+        for entity_id, entity_json in result.get('entities', {}).items():
+            if 'missing' not in entity_json:
+                summaries[entity_id] = wb_actions.parse_item_summary(entity_json, props)
+    return summaries
+
+
+async def async_get_item(client: AsyncWikibaseClient, item_id: str) -> entities.item.ItemEntity:
+    """
+    Args:
+        client (AsyncWikibaseClient): API client
+        item_id (str): ID of the item
+    Returns:
+        entities.item.ItemEntity: item entity
+    Raises:
+        ValueError: if the item does not exist
+    """
+    items = await async_get_items_bulk(client, [item_id])
+    if item_id not in items:
+        raise ValueError('Item ' + item_id + ' does not exist')
+    return items[item_id]
+
+
+async def async_write_item(client: AsyncWikibaseClient, wbi_item: entities.item.ItemEntity) -> entities.item.ItemEntity:
+    """
+    Writes the complete item in one 'wbeditentity' call (see wb_actions.write_item)
+    Args:
+        client (AsyncWikibaseClient): API client
+        wbi_item (entities.item.ItemEntity): item entity to be written
+    Returns:
+        entities.item.ItemEntity: written item entity
+    """
+    is_new = wbi_item.id is None
+    data = { 'action': 'wbeditentity', 'data': json.dumps(wbi_item.get_json()) }
+    if is_new:
+        data['new'] = 'item'
+    else:
+        data['id'] = wbi_item.id
+        if wbi_item.lastrevid:
+            data['baserevid'] = wbi_item.lastrevid
+    try:
+        result = await client.edit(data)
+    except Exception:
+        if not is_new:
+            # the cached entity may be outdated (e.g. edit conflict)
+            wb_actions.entity_cache.remove([wbi_item.id])
+        raise
+    wb_actions.entity_cache.set(result['entity'])
+    written_item = entities.item.ItemEntity().from_json(result['entity'])
+    if is_new:
+        wb_actions.remember_new_item(written_item)
+    return written_item
+
+
+async def async_check_if_item_exists(client: AsyncWikibaseClient, label: str, description: str,
+                                     remember_missing: bool = True) -> str:
+    """
+    Checks if the item with given label and description exists in Wikibase (see wb_actions.check_if_item_exists)
+    Args:
+        client (AsyncWikibaseClient): API client
+        label (str): label of the item in Polish
+        description (str): description of the item in Polish (any description if empty)
+        remember_missing (bool): if False, the negative result is not stored (the caller is about to create the item)
+    Returns:
+        str: ID of the existing item or an empty string
+    """
+    known_id = wb_actions.get_known_item_id(label, 'description', description)
+    if known_id is not None:
+        return known_id
+    result = await async_search_entities(client, label)
+    items = await async_get_item_summaries(client, result)
+    for item_id in result:
+        item_summary = items.get(item_id)
+        if item_summary is not None and (not description or item_summary.description == description):
+            wb_actions.set_known_item_id(label, 'description', description, item_id)
+            return item_id
+    if remember_missing:
+        wb_actions.set_known_item_id(label, 'description', description, '')
+    return ''
+
+
+async def async_search_for_item_with_property(client: AsyncWikibaseClient, label: str, prop_id: str, prop_value_id: str) -> str:
+    """
+    Checks if the item with given label exists in Wikibase and if it has given property with given value
+    with an exact SPARQL lookup, or with a search if the SPARQL endpoint is not available
+    (see wb_actions.search_for_item_with_property)
+    Args:
+        client (AsyncWikibaseClient): API client
+        label (str): label of the item in Polish
+        prop_id (str): ID of the property to check
+        prop_value_id (str): ID of the value of the property to check
+    Returns:
+        str: ID of the existing item or an empty string (also if the label or the value is empty)
+    """
+    if not label or not prop_value_id:
+        return ''
+    known_id = wb_actions.get_known_item_id(label, prop_id, prop_value_id)
+    if known_id is not None:
+        return known_id
+    found_id = None
+    if exact_lookup.is_sparql_available():
+        # exact SPARQL lookup (one query instead of a search and a fetch) runs in a thread of the default executor
+        try:
+            found_id = await asyncio.get_running_loop().run_in_executor(None, exact_lookup.lookup_item_with_property,
+                                                                        label, prop_id, prop_value_id)
+        except sparql.SparqlError as e:
+            exact_lookup.disable_sparql(e)
+    if found_id is None:
+        found_id = ''
+        result = await async_search_entities(client, label)
+        items = await async_get_item_summaries(client, result, [prop_id])
+        for item_id in result:
+            item_summary = items.get(item_id)
+            if item_summary is not None and item_summary.label == label and item_summary.has_property_value(prop_id, prop_value_id):
+                found_id = item_id
+                break
+    wb_actions.set_known_item_id(label, prop_id, prop_value_id, found_id)
+    return found_id
+
+
+async def async_add_new_item(client: AsyncWikibaseClient, label_pl: str, description_pl: str, description_en: str,
+                             claims: Optional[List[BaseDataType]] = None, write: bool = True,
+                             check_existing: bool = True) -> entities.item.ItemEntity:
+    """
+    Checks if the item with given label and description (both in Polish) exists in Wikibase, if not
+    then adds it (see wb_actions.add_new_item); with write=False the caller should hold its own lock
+    of the item until it is written, so that the same item is not created twice
+    Args:
+        client (AsyncWikibaseClient): API client
+        label_pl (str): label of the item in Polish
+        description_pl (str): description of the item in Polish
+        description_en (str): description of the item in English
+        claims (Optional[List[BaseDataType]]): claims to be added to the item
+        write (bool): if False, the item is not written to Wikibase (see async_write_item)
+        check_existing (bool): if False, the item is created without checking (the caller has just looked it up)
+    Returns:
+        entities.item.ItemEntity: added item entity or existing item entity
+    """
+    async with get_key_lock((label_pl, 'description', description_pl)):
+        item_id = (await async_check_if_item_exists(client, label_pl, description_pl, remember_missing=False)
+                   if check_existing else '')
+        if not item_id:
+            wbi_item = entities.item.ItemEntity()
+            wbi_item.labels.set(language='pl', value=label_pl)
+            wbi_item.labels.set(language='en', value=label_pl)
+            wbi_item.descriptions.set(language='pl', value=description_pl)
+            wbi_item.descriptions.set(language='en', value=description_en)
+        else:
+            logger.debug('Item already exists in Wikibase with ID = %s', item_id)
+            wbi_item = await async_get_item(client, item_id)
+        if claims:
+            wbi_item.claims.add(claims)
+        if write and (not item_id or claims):
+            wbi_item = await async_write_item(client, wbi_item)
+        return wbi_item
+
+
+async def async_get_or_create_item_with_property(client: AsyncWikibaseClient, label: str, prop_id: str, prop_value_id: str,
+                                                 description_pl: str, description_en: str) -> str:
+    """
+    Returns the ID of the item with given label and property value, creating it if it does not exist
+    (see wb_actions.get_or_create_item_with_property)
+    """
+    async with get_key_lock((label, prop_id, prop_value_id)):
+        item_id = await async_search_for_item_with_property(client, label, prop_id, prop_value_id)
+        if not item_id:
+            new_item = await async_add_new_item(client, label, description_pl, description_en,
+                                                claims=[Item(value=prop_value_id, prop_nr=prop_id)], check_existing=False)
+            item_id = new_item.id
+            if prop_id != wb_actions.INSTANCE_OF_PROPERTY:
+                # new items are registered only by their class (see wb_actions.remember_new_item)
+                wb_actions.set_known_item_id(label, prop_id, prop_value_id, item_id)
+        return item_id
+
+
+async def async_get_or_create_item(client: AsyncWikibaseClient, label: str, description_pl: str, description_en: str,
+                                   prop_id: str, prop_value_id: str) -> str:
+    """
+    Returns the ID of the item with given label (and any description), creating it if it does not exist
+    (see wb_actions.get_or_create_item)
+    """
+    async with get_key_lock((label, 'description', '')):
+        item_id = await async_check_if_item_exists(client, label, '', remember_missing=False)
+        if not item_id:
+            new_item = await async_add_new_item(client, label, description_pl, description_en,
+                                                claims=[Item(value=prop_value_id, prop_nr=prop_id)], check_existing=False)
+            item_id = new_item.id
+        return item_id
+
+
+async def async_resolve_vocabulary(client: AsyncWikibaseClient, vocabulary: Dict[str, Set]):
+    """
+    Looks up (concurrently) all given vocabulary values and creates missing vocabulary items, so that
+    building statements with properties_actions needs no further API calls
+    Args:
+        client (AsyncWikibaseClient): API client
+        vocabulary (Dict[str, Set]): sets of distinct values by category (see vocabulary_resolver.collect_vocabulary)
+    """
+    lookups = []
+    for category, (prop_id, prop_value_id) in CATEGORY_PROPERTIES.items():
+        description_pl, description_en = CATEGORY_DESCRIPTIONS[category]
+        lookups += [async_get_or_create_item_with_property(client, label, prop_id, prop_value_id, description_pl, description_en)
+                    for label in vocabulary[category]]
+    description_pl, description_en = CATEGORY_DESCRIPTIONS['offices']
+    lookups += [async_get_or_create_item(client, label, description_pl, description_en, '47', 'Q65')
+                for label in vocabulary['offices']]
+    lookups += [async_search_for_item_with_property(client, name, 'P274', prng) for name, prng in vocabulary['places']]
+    await asyncio.gather(*lookups)
@@ -1,73 +1,179 @@
 from wikibaseintegrator.wbi_enums import WikibaseDatePrecision
 
-from typing import Tuple
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import datetime
+import logging
+import re
 
 
-def get_numeric_value_precision_and_qualifier(date: str) -> Tuple[str, str, str]:
+logger = logging.getLogger(__name__)
+
+CALENDAR_MODEL = 'http://www.wikidata.org/entity/Q1985727'
+
+# qualifier kinds (applicable Wikibase property IDs, except for ranges)
+QUALIFIER_CIRCA = 'P189'
+QUALIFIER_AFTER = 'P38'
+QUALIFIER_BEFORE = 'P39'
+QUALIFIER_RANGE = 'range'
+
+# item 'circa' used as a value of the qualifier P189
+CIRCA_ITEM_ID = 'Q37979'
+
+# names of fields (xml elements) which contain dates
+PERSON_DATE_TAGS = ('date_of_birth', 'date_of_death', 'floruit')
+POSITION_DATE_TAGS = ('start_date', 'end_date', 'date')
+
+ROMAN_NUMERALS = { 'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000 }
+
+
+class DateValue(NamedTuple):
+    """
+    Normalised date: Wikibase time (empty if the date was not recognized), its precision and optional
+    qualifier kind (and the end of the period for ranges)
+    """
+    time: str
+    precision: Optional[WikibaseDatePrecision]
+    qualifier: str = ''
+    end_time: str = ''
+
+
+UNRECOGNIZED_DATE = DateValue('', None)
+
+
+def roman_to_int(roman: str) -> int:
+    """
+    Converts Roman numeral into an integer
+    Args:
+        roman (str): Roman numeral (e.g. 'XVIII')
+    Returns:
+        int: value of the numeral
+    Raises:
+        ValueError: if the text is not a valid Roman numeral
+    """
+    if not roman or any(char not in ROMAN_NUMERALS for char in roman):
+        raise ValueError('Invalid Roman numeral: ' + roman)
+    values = [ROMAN_NUMERALS[char] for char in roman]
+    return sum(-value if value < next_value else value for value, next_value in zip(values, values[1:] + [0]))
+
+
+def _format_time(year: int, month: int = 1, day: int = 1) -> str:
+    # raises ValueError for dates which do not exist (e.g. 30 February), Wikibase would reject them
+    datetime.date(year, month, day)
+    return f'+{year:04d}-{month:02d}-{day:02d}T00:00:00Z'
+
+
+def _parse_year(match: re.Match) -> DateValue:
+    return DateValue(_format_time(int(match.group(1))), WikibaseDatePrecision.YEAR)
+
+
+def _parse_day(match: re.Match) -> DateValue:
+    day, month, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    return DateValue(_format_time(year, month, day), WikibaseDatePrecision.DAY)
+
+
+def _parse_month(match: re.Match) -> DateValue:
+    month, year = int(match.group(1)), int(match.group(2))
+    return DateValue(_format_time(year, month), WikibaseDatePrecision.MONTH)
+
+
+def _parse_century(match: re.Match) -> DateValue:
+    century = roman_to_int(match.group(1))
+    return DateValue(_format_time((century - 1) * 100 + 1), WikibaseDatePrecision.CENTURY)
+
+
+def _with_qualifier(qualifier: str) -> Callable[[re.Match], DateValue]:
+    def parse(match: re.Match) -> DateValue:
+        inner = _parse_text(match.group(1))
+        if inner.qualifier or not inner.time:
+            return UNRECOGNIZED_DATE
+        return inner._replace(qualifier=qualifier)
+    return parse
+
+
+def _parse_range(match: re.Match) -> DateValue:
+    start, end = _parse_text(match.group(1)), _parse_text(match.group(2))
+    if not start.time or not end.time or start.qualifier or end.qualifier:
+        return UNRECOGNIZED_DATE
+    return DateValue(start.time, start.precision, QUALIFIER_RANGE, end.time)
+
+
+# patterns are tried in order, the first one which matches the whole text is used
+DATE_PATTERNS: List[Tuple[re.Pattern, Callable[[re.Match], DateValue]]] = [
+    (re.compile(r'(\d{3,4})'), _parse_year),
+    (re.compile(r'(\d{1,2})[-./](\d{1,2})[-./](\d{3,4})'), _parse_day),
+    (re.compile(r'(\d{1,2})[-./](\d{3,4})'), _parse_month),
+    (re.compile(r'([IVXLCDM]+)\s*w\.?'), _parse_century),
+    (re.compile(r'(?:ok\.|około|ca\.?)\s*(.+)'), _with_qualifier(QUALIFIER_CIRCA)),
+    (re.compile(r'po\s+(.+)'), _with_qualifier(QUALIFIER_AFTER)),
+    (re.compile(r'przed\s+(.+)'), _with_qualifier(QUALIFIER_BEFORE)),
+    (re.compile(r'(?:między\s+)?(.+?)\s*(?:[-–—]|\s+a\s+)\s*(.+)'), _parse_range),
+]
+
+
+@lru_cache(maxsize=None)
+def _parse_text(date: str) -> DateValue:
+    # also used for parts of dates (e.g. ends of ranges), so it does not report unrecognized dates
+    text = ' '.join(date.split())
+    for pattern, parse in DATE_PATTERNS:
+        match = pattern.fullmatch(text)
+        if match is not None:
+            try:
+                value = parse(match)
+            except ValueError:
+                continue
+            if value.time:
+                return value
+    return UNRECOGNIZED_DATE
+
+
+@lru_cache(maxsize=None)
+def parse_date(date: str) -> DateValue:
     """
-    Retrieves information about exact date, its precision and optional qualifier
+    Converts date with optional additional information (about, after, before, century, range) into
+    normalised date value; results are memoised, so repeated dates are parsed (and reported) only once
     Args:
-        date (str): date with optional additional information (about, before, etc.)
+        date (str): date, e.g. '1720', '15-08-1802', 'XVIII w.', 'ok. 1640', 'po 1775', 'przed 1663', '1720-1730'
     Returns:
-        Tuple[str, str, str]: date without additional information, date precision (century, year, date)
-        and optional qualifier (applicable Wikibase property name) 
+        DateValue: normalised date (UNRECOGNIZED_DATE if the date was not recognized)
     """
-    roman_numbers = { 'X' :'10', 'XI': '11', 'XII': '10', 'XIII': '13', 'XIV': '14', 
-                    'XV': '15', 'XVI': '16', 'XVII': '17', 'XVIII': '18', 'XIX': '19' }
-    numeric_value = ''
-    precision = ''
-    qualifier = ''
-    
-    if len(date.split()) > 1:
-        if 'w.' in date:
-            roman_value = date[:-3]
-            numeric_value = roman_numbers[roman_value]
-            precision = WikibaseDatePrecision.CENTURY
-        elif 'ok.' in date:
-            numeric_value = date[4:]
-            precision = WikibaseDatePrecision.YEAR
-            qualifier = 'P189'
-        elif 'po' in date:
-            numeric_value = date[3:]
-            precision = WikibaseDatePrecision.YEAR
-            qualifier = 'P38'
-        elif 'przed' in date:
-            numeric_value = date[6:]
-            precision = WikibaseDatePrecision.YEAR
-            qualifier = 'P39'
-        else:
-            print("Date was not recognized.")
-    else:
-        if len(date) == 4:
-            numeric_value = date
-            precision = WikibaseDatePrecision.YEAR
-        elif len(date) == 10:
-            day = date[0:2]
-            month = date[3:5]
-            year = date[6:]
-            numeric_value = year + '-' + month + '-' + day
-            precision = WikibaseDatePrecision.DAY
-        else:
-            print("Date was not recognized.")
-    return numeric_value, precision, qualifier
-
-
-def get_wbi_time(numeric_value: str) -> str:
+    value = _parse_text(date)
+    if not value.time:
+        logger.warning('Date %s was not recognized', date)
+    return value
+
+
+def normalise_dates(dates: Iterable[str]) -> Dict[str, DateValue]:
+    """
+    Normalises all given dates in one pass
+    Args:
+        dates (Iterable[str]): dates in the input format
+    Returns:
+        Dict[str, DateValue]: normalised dates by input text
+    """
+    return { date: parse_date(date) for date in dates }
+
+
+def get_person_date_texts(person) -> List[str]:
     """
-    Converts simple date into Wikibase date/time format
-    Heavily inspired by the function 'format_date' from 
-    https://github.com/pjaskulski/wikihub_skrypty/blob/main/src/wikidariahtools.py
     Args:
-        numeric_value (str): date (century, year, day-month-year)
+        person (xml_parser.Person): record with all data about one person
     Returns:
-        str: date in Wikibase format '+yyyy-mm-ddT00:00:00Z' (months and days cannot be set to '00')
+        List[str]: texts of all date fields of the person (including dates of held positions)
     """
-    wbi_time = ''
-    if len(numeric_value) == 4:
-        wbi_time = f"+{numeric_value}-01-01T00:00:00Z"
-    elif len(numeric_value) == 10:
-        wbi_time = f"+{numeric_value}T00:00:00Z"
-    elif len(numeric_value) == 2:
-        wbi_time = f"+{str(int(numeric_value)-1)}01-01-01T00:00:00Z"
-    return wbi_time
+    texts = [getattr(person, field) for field in PERSON_DATE_TAGS]
+    texts += [getattr(position, field) for position in person.positions for field in POSITION_DATE_TAGS]
+    return [text for text in texts if text]
+
 
+def get_time_datavalue(time: str, precision: WikibaseDatePrecision) -> dict:
+    """
+    Builds Wikibase datavalue of type 'time' (e.g. for qualifiers)
+    Args:
+        time (str): time in Wikibase format '+yyyy-mm-ddT00:00:00Z'
+        precision (WikibaseDatePrecision): precision of the time
+    Returns:
+        dict: datavalue
+    """
+    return { 'value': { 'time': time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': precision.value,
+                        'calendarmodel': CALENDAR_MODEL }, 'type': 'time' }
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import traceback
+import xml.etree.ElementTree as ET
+from typing import Callable, Iterator, List, Optional
+
+from tools.xml_parser import Person, get_label_and_description, get_person_shard, parse_person
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEAD_LETTER_PATH = 'failed_persons.jsonl'
+
+# so many failures in a row mean that Wikibase (not the data) is the problem, so the import is stopped
+MAX_CONSECUTIVE_FAILURES = 50
+
+
+class TooManyFailuresError(Exception):
+    pass
+
+
+class DeadLetterFile:
+    """
+    Append-only (JSON Lines) file of persons whose import failed, with the error and the original xml
+    fragment; every entry is appended with one write, so the file can be shared by forked processes;
+    entries are written to a temporary file, which replaces the file when it is closed, so the previous
+    content stays available until the import ends (e.g. persons retried with --retry-failed)
+    """
+
+    def __init__(self, path: str = DEFAULT_DEAD_LETTER_PATH, max_consecutive_failures: int = MAX_CONSECUTIVE_FAILURES):
+        """
+        Args:
+            path (str): path of the file (its previous content is replaced when the file is closed)
+            max_consecutive_failures (int): number of failures in a row after which the import is stopped
+        """
+        self.path = path
+        self.temp_path = path + '.part'
+        self.max_consecutive_failures = max_consecutive_failures
+        self.count = 0
+        self._consecutive_failures = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+
+    def add(self, xml: Optional[str], error: Exception, person: Optional[Person] = None, count_failure: bool = True):
+        """
+        Appends the failed person to the file
+        Args:
+            xml (Optional[str]): xml fragment of the person
+            error (Exception): error of the import (or of parsing)
+            person (Optional[Person]): record of the person, if it was parsed
+            count_failure (bool): if False, the failure is not counted as a failure in a row
+        Raises:
+            TooManyFailuresError: if too many persons failed in a row
+        """
+        entry = { 'error': f'{type(error).__name__}: {error}',
+                  'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+                  'xml': xml }
+        if person is not None:
+            try:
+                entry['label'], entry['description'] = get_label_and_description(person)
+            except Exception:
+                pass
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            os.write(self._fd, line.encode('utf-8'))
+            self.count += 1
+            if count_failure:
+                self._consecutive_failures += 1
+            consecutive_failures = self._consecutive_failures
+        logger.error('Import of person %s failed (%s), written to %s', entry.get('label', '(not parsed)'), entry['error'],
+                     self.path)
+        if count_failure and consecutive_failures >= self.max_consecutive_failures:
+            raise TooManyFailuresError(f'{consecutive_failures} persons failed in a row, the last error: {entry["error"]}') from error
+
+    def add_success(self):
+        """
+        Notes that a person was imported (see max_consecutive_failures)
+        """
+        self._consecutive_failures = 0
+
+    def add_unparsed(self, xml: str, error: Exception):
+        """
+        Appends the person which cannot be parsed to the file; such errors are caused by the data, so they
+        are not counted as failures in a row (see max_consecutive_failures)
+        Args:
+            xml (str): xml fragment of the person
+            error (Exception): error of parsing
+        """
+        self.add(xml, error, count_failure=False)
+
+    def close(self, replace: bool = True):
+        """
+        Closes the file
+        Args:
+            replace (bool): if True, the file is replaced by entries of this run, otherwise they are removed
+            and the previous content is kept
+        """
+        os.close(self._fd)
+        if replace:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+def read_failed_fragments(path: str = DEFAULT_DEAD_LETTER_PATH) -> List[str]:
+    """
+    Reads xml fragments of failed persons from the dead-letter file (see DeadLetterFile)
+    Args:
+        path (str): path of the file
+    Returns:
+        List[str]: xml fragments of the persons
+    """
+    fragments = []
+    if not os.path.exists(path):
+        return fragments
+    with open(path, encoding='utf-8') as dead_letter_file:
+        for line in dead_letter_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # last line may be truncated if the previous run was killed while writing
+                continue
+            if entry.get('xml'):
+                fragments.append(entry['xml'])
+    return fragments
+
+
+def iter_failed_persons(fragments: List[str], shard: int = 0, shards: int = 1,
+                        on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Person]:
+    """
+    Parses xml fragments of failed persons (see read_failed_fragments), e.g. to import them again
+    Args:
+        fragments (List[str]): xml fragments of the persons
+        shard (int): number of the shard to be read (see xml_parser.get_person_shard)
+        shards (int): number of all shards
+        on_error (Optional[Callable[[str, Exception], None]]): if given, it is called with the xml fragment
+        and the error of each person which cannot be parsed and the person is skipped
+    Returns:
+        Iterator[Person]: records of the persons with their xml fragments
+    """
+    for index, fragment in enumerate(fragments):
+        try:
+            person = parse_person(ET.fromstring(fragment))
+            if shards > 1 and get_person_shard(person, shards) != shard:
+                continue
+        except Exception as e:
+            # persons which cannot be parsed are reported by one shard only
+            if index % shards != shard:
+                continue
+            if on_error is None:
+                raise
+            on_error(fragment, e)
+            continue
+        person.xml = fragment
+        yield person
@@ -0,0 +1,205 @@
+from wikibaseintegrator.wbi_enums import WikibaseDatePrecision
+
+import collections
+import logging
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from tools import sparql
+from tools.xml_parser import Person, get_label_and_description
+import tools.dates_formatter as dates_formatter
+import tools.wb_actions as wb_actions
+
+
+logger = logging.getLogger(__name__)
+
+SPARQL_PAGE_SIZE = 5000
+
+# given names are separated with this character in results of the query about existing persons
+GIVEN_NAMES_SEPARATOR = '|'
+
+
+class PersonSignature(NamedTuple):
+    """
+    Normalised data used to recognize the same person: surname, given names (sorted, separated by spaces),
+    coat of arms and years of birth and death (empty strings if unknown)
+    """
+    surname: str
+    given_names: str
+    coat_of_arms: str
+    birth_year: str
+    death_year: str
+
+
+def normalise(text: Optional[str]) -> str:
+    """
+    Args:
+        text (Optional[str]): text to be normalised (e.g. a name)
+    Returns:
+        str: text in lower case, without diacritics and redundant whitespace
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text.replace('ł', 'l').replace('Ł', 'L'))
+    return ' '.join(''.join(char for char in text if not unicodedata.combining(char)).lower().split())
+
+
+def _get_year(date: Optional[str]) -> str:
+    if not date:
+        return ''
+    value = dates_formatter.parse_date(date)
+    if (not value.time or value.qualifier not in ('', dates_formatter.QUALIFIER_CIRCA)
+            or value.precision.value < WikibaseDatePrecision.YEAR.value):
+        return ''
+    return str(int(value.time[1:5]))
+
+
+def get_person_signature(person: Person) -> PersonSignature:
+    """
+    Args:
+        person (Person): record with all data about one person
+    Returns:
+        PersonSignature: normalised data of the person
+    """
+    coat_of_arms = person.coat_of_arms if person.coat_of_arms and 'nieznany' not in person.coat_of_arms else ''
+    return PersonSignature(normalise(person.surname), ' '.join(sorted(normalise(person.name).split())),
+                           normalise(coat_of_arms), _get_year(person.date_of_birth), _get_year(person.date_of_death))
+
+
+def get_blocking_keys(signature: PersonSignature) -> List[tuple]:
+    """
+    Returns keys of blocks in which the person is put: names and coat of arms with the year of birth
+    or with the year of death; persons without surname or without both years are not put in any block
+    Args:
+        signature (PersonSignature): normalised data of the person
+    Returns:
+        List[tuple]: blocking keys
+    """
+    if not signature.surname:
+        return []
+    names = (signature.surname, signature.given_names, signature.coat_of_arms)
+    keys = []
+    if signature.birth_year:
+        keys.append(names + ('birth', signature.birth_year))
+    if signature.death_year:
+        keys.append(names + ('death', signature.death_year))
+    return keys
+
+
+def _are_compatible(signature: PersonSignature, other: PersonSignature) -> bool:
+    return all(not value or not other_value or value == other_value
+               for value, other_value in ((signature.birth_year, other.birth_year), (signature.death_year, other.death_year)))
+
+
+class BlockingIndex:
+    """
+    Index of persons by blocking keys (see get_blocking_keys); only persons in the same block are compared,
+    so finding duplicates among n persons takes roughly linear time
+    """
+
+    def __init__(self):
+        self.blocks: Dict[tuple, List[Tuple[object, PersonSignature]]] = collections.defaultdict(list)
+
+    def add(self, reference: object, signature: PersonSignature):
+        """
+        Args:
+            reference (object): reference of the person returned by find (e.g. item ID)
+            signature (PersonSignature): normalised data of the person
+        """
+        for key in get_blocking_keys(signature):
+            self.blocks[key].append((reference, signature))
+
+    def find(self, signature: PersonSignature) -> Optional[object]:
+        """
+        Args:
+            signature (PersonSignature): normalised data of the person
+        Returns:
+            Optional[object]: reference of the first indexed person in the same block whose years do not
+            contradict given data, None if there is no such person
+        """
+        for key in get_blocking_keys(signature):
+            for reference, other_signature in self.blocks.get(key, []):
+                if _are_compatible(signature, other_signature):
+                    return reference
+        return None
+
+
+def iter_existing_persons() -> Iterator[Tuple[str, PersonSignature]]:
+    """
+    Reads (in pages) all items which are instances of 'human' with their names, coats of arms and years
+    of birth and death (only dates with at least year precision) from the SPARQL endpoint
+    Returns:
+        Iterator[Tuple[str, PersonSignature]]: IDs of the items with normalised data of the persons
+    """
+    offset = 0
+    while True:
+        query = (f"SELECT ?item (SAMPLE(?surnameLabel) AS ?surname) "
+                 f"(GROUP_CONCAT(DISTINCT ?givenNameLabel; separator=\"{GIVEN_NAMES_SEPARATOR}\") AS ?givenNames) "
+                 f"(SAMPLE(?coatOfArmsLabel) AS ?coatOfArms) (MIN(?birthYear) AS ?birth) (MIN(?deathYear) AS ?death) "
+                 f"WHERE {{ {{ SELECT ?item WHERE {{ ?item wdt:P47 wd:Q32 . }} ORDER BY ?item "
+                 f"LIMIT {SPARQL_PAGE_SIZE} OFFSET {offset} }} "
+                 f"OPTIONAL {{ ?item wdt:P183/rdfs:label ?surnameLabel . FILTER(LANG(?surnameLabel) = \"pl\") }} "
+                 f"OPTIONAL {{ ?item wdt:P184/rdfs:label ?givenNameLabel . FILTER(LANG(?givenNameLabel) = \"pl\") }} "
+                 f"OPTIONAL {{ ?item wdt:P27/rdfs:label ?coatOfArmsLabel . FILTER(LANG(?coatOfArmsLabel) = \"pl\") }} "
+                 f"OPTIONAL {{ ?item p:P7/psv:P7 ?birthValue . ?birthValue wikibase:timePrecision ?birthPrecision ; "
+                 f"wikibase:timeValue ?birthTime . FILTER(?birthPrecision >= 9) BIND(YEAR(?birthTime) AS ?birthYear) }} "
+                 f"OPTIONAL {{ ?item p:P8/psv:P8 ?deathValue . ?deathValue wikibase:timePrecision ?deathPrecision ; "
+                 f"wikibase:timeValue ?deathTime . FILTER(?deathPrecision >= 9) BIND(YEAR(?deathTime) AS ?deathYear) }} "
+                 f"}} GROUP BY ?item")
+        bindings = sparql.run_query(query)
+        for binding in bindings:
+            given_names = binding.get('givenNames', {}).get('value', '').split(GIVEN_NAMES_SEPARATOR)
+            yield sparql.get_entity_id(binding), PersonSignature(
+                normalise(binding.get('surname', {}).get('value')),
+                ' '.join(sorted(name for given_name in given_names for name in normalise(given_name).split())),
+                normalise(binding.get('coatOfArms', {}).get('value')),
+                str(int(binding['birth']['value'])) if 'birth' in binding else '',
+                str(int(binding['death']['value'])) if 'death' in binding else '')
+        if len(bindings) < SPARQL_PAGE_SIZE:
+            return
+        offset += SPARQL_PAGE_SIZE
+
+
+def find_duplicates(persons: Iterable[Person], existing_persons: Iterable[Tuple[str, PersonSignature]]) -> List[dict]:
+    """
+    Finds persons which are already in Wikibase and persons which repeat in the input
+    Args:
+        persons (Iterable[Person]): records with all data about persons to be imported
+        existing_persons (Iterable[Tuple[str, PersonSignature]]): IDs and normalised data of human items
+        (see iter_existing_persons)
+    Returns:
+        List[dict]: duplicates: label and description of the person with ID of the matching item ('item_id')
+        or with label and description of the earlier person from the input ('duplicate_of')
+    """
+    index = BlockingIndex()
+    for item_id, signature in existing_persons:
+        index.add(item_id, signature)
+    duplicates = []
+    for person in persons:
+        signature = get_person_signature(person)
+        label, description = get_label_and_description(person)
+        reference = index.find(signature)
+        if reference is None:
+            index.add((label, description), signature)
+        elif isinstance(reference, str):
+            duplicates.append({ 'label': label, 'description': description, 'item_id': reference })
+        else:
+            duplicates.append({ 'label': label, 'description': description, 'duplicate_of': list(reference) })
+    return duplicates
+
+
+def merge_duplicates(duplicates: List[dict]) -> int:
+    """
+    Makes persons found in Wikibase be imported into the matching items (their statements are added
+    to these items and no search is needed to find them)
+    Args:
+        duplicates (List[dict]): duplicates found by find_duplicates
+    Returns:
+        int: number of persons merged with existing items
+    """
+    merged = 0
+    for duplicate in duplicates:
+        if 'item_id' in duplicate:
+            wb_actions.preresolved_items[(duplicate['label'], 'description', duplicate['description'])] = duplicate['item_id']
+            merged += 1
+    return merged
@@ -0,0 +1,62 @@
+import gzip
+import json
+import threading
+import uuid
+
+
+def get_dump_entity(entity_json: dict) -> dict:
+    """
+    Completes entity JSON of a new item (as built by wikibaseintegrator) to the format of Wikibase JSON dumps:
+    all sections are present and all statements have IDs
+    Args:
+        entity_json (dict): entity JSON with ID of the item
+    Returns:
+        dict: entity JSON for the dump
+    """
+    entity = { 'type': 'item', 'id': entity_json['id'] }
+    for section in ('labels', 'descriptions', 'aliases', 'claims', 'sitelinks'):
+        entity[section] = entity_json.get(section) or {}
+    for claims in entity['claims'].values():
+        for claim in claims:
+            claim.setdefault('id', entity['id'] + '$' + str(uuid.uuid4()).upper())
+    return entity
+
+
+class DumpWriter:
+    """
+    Streaming writer of Wikibase JSON dump (JSON array with one entity per line, like the dumps of Wikidata),
+    gzip-compressed if the path ends with '.gz'
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path of the dump file
+        """
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        if path.endswith('.gz'):
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+
+    def write(self, entity_json: dict):
+        """
+        Appends the entity to the dump
+        Args:
+            entity_json (dict): entity JSON of the new item with its ID (see get_dump_entity)
+        """
+        line = json.dumps(get_dump_entity(entity_json), ensure_ascii=False)
+        with self._lock:
+            self._file.write((',\n' if self.count else '') + line)
+            self.count += 1
+
+    def close(self):
+        """
+        Ends the JSON array and closes the file
+        """
+        with self._lock:
+            self._file.write('\n]\n')
+            self._file.close()
@@ -0,0 +1,123 @@
+import collections
+import json
+import time
+from typing import Dict, Iterable, Optional
+
+from tools.sqlite_cache import SqliteCache
+
+
+DEFAULT_ENTITY_CACHE_PATH = 'cache/entity_cache.sqlite'
+DEFAULT_MEMORY_SIZE = 1000
+
+
+class EntityCache(SqliteCache):
+    """
+    Persistent (SQLite) cache of complete entities (JSON with the revision ID) with the most recently used
+    entities also kept in memory; entries stored in previous runs are used only after their revision IDs
+    are checked (see get_unchecked and mark_checked), entries stored in this run are trusted
+    """
+    TABLE_SCHEMA = ('CREATE TABLE IF NOT EXISTS entities ('
+                    'id TEXT NOT NULL PRIMARY KEY, lastrevid INTEGER NOT NULL, json TEXT NOT NULL, checked REAL NOT NULL)')
+
+    def __init__(self, path: str = DEFAULT_ENTITY_CACHE_PATH, memory_size: int = DEFAULT_MEMORY_SIZE,
+                 refresh: bool = False):
+        """
+        Args:
+            path (str): path of the SQLite database file (created if needed)
+            memory_size (int): maximal number of entities kept in memory
+            refresh (bool): if True, stored entries are ignored (but still overwritten by new entities)
+        """
+        self.memory_size = memory_size
+        # entries checked (or stored) since this moment are valid, it is inherited by forked processes
+        self.run_started = time.time()
+        self._memory: Dict[str, str] = collections.OrderedDict()
+        super().__init__(path, refresh)
+
+    def _remember(self, entity_id: str, entity_text: str):
+        self._memory[entity_id] = entity_text
+        self._memory.move_to_end(entity_id)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, entity_id: str) -> Optional[dict]:
+        """
+        Returns cached entity which is valid in this run
+        Args:
+            entity_id (str): ID of the entity
+        Returns:
+            Optional[dict]: entity JSON (a new copy) or None if there is no valid entry
+        """
+        with self._lock:
+            if not self.refresh:
+                entity_text = self._memory.get(entity_id)
+                if entity_text is None:
+                    row = self._connection.execute('SELECT json FROM entities WHERE id=? AND checked>=?',
+                                                   (entity_id, self.run_started)).fetchone()
+                    if row is not None:
+                        entity_text = row[0]
+                if entity_text is not None:
+                    self._remember(entity_id, entity_text)
+                    self.hits += 1
+                    return json.loads(entity_text)
+            self.misses += 1
+            return None
+
+    def get_unchecked(self, ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Returns entries stored in previous runs, whose revision IDs have to be checked before they are used
+        Args:
+            ids (Optional[Iterable[str]]): IDs of the entities (all entries if None)
+        Returns:
+            Dict[str, int]: revision IDs of the cached entities by ID
+        """
+        if self.refresh:
+            return {}
+        with self._lock:
+            if ids is None:
+                rows = self._connection.execute('SELECT id, lastrevid FROM entities WHERE checked<?',
+                                                (self.run_started,)).fetchall()
+                return dict(rows)
+            unchecked = {}
+            for entity_id in ids:
+                row = self._connection.execute('SELECT lastrevid FROM entities WHERE id=? AND checked<?',
+                                               (entity_id, self.run_started)).fetchone()
+                if row is not None:
+                    unchecked[entity_id] = row[0]
+            return unchecked
+
+    def set(self, entity_json: dict):
+        """
+        Stores the entity (valid in this run)
+        Args:
+            entity_json (dict): entity JSON with its ID and revision ID ('lastrevid')
+        """
+        entity_text = json.dumps(entity_json, ensure_ascii=False)
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?)',
+                                     (entity_json['id'], int(entity_json['lastrevid']), entity_text, time.time()))
+            self._connection.commit()
+            self._remember(entity_json['id'], entity_text)
+
+    def mark_checked(self, ids: Iterable[str]):
+        """
+        Marks entries as valid in this run (their revision IDs are the current ones)
+        Args:
+            ids (Iterable[str]): IDs of the entities
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.executemany('UPDATE entities SET checked=? WHERE id=?', ((now, entity_id) for entity_id in ids))
+            self._connection.commit()
+
+    def remove(self, ids: Iterable[str]):
+        """
+        Removes entries (e.g. of entities changed or deleted since they were stored)
+        Args:
+            ids (Iterable[str]): IDs of the entities
+        """
+        ids = list(ids)
+        with self._lock:
+            self._connection.executemany('DELETE FROM entities WHERE id=?', ((entity_id,) for entity_id in ids))
+            self._connection.commit()
+            for entity_id in ids:
+                self._memory.pop(entity_id, None)
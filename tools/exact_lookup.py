@@ -0,0 +1,110 @@
+import collections
+import logging
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from tools import sparql
+
+
+logger = logging.getLogger(__name__)
+
+SPARQL_CHUNK_SIZE = 200
+ITEM_ID_PATTERN = re.compile(r'Q\d+')
+
+_sparql_available = True
+_sparql_available_lock = threading.Lock()
+
+
+def is_sparql_available() -> bool:
+    """
+    Returns:
+        bool: False if a query to the SPARQL endpoint failed in this run
+    """
+    return _sparql_available
+
+
+def disable_sparql(error: sparql.SparqlError):
+    """
+    Marks the SPARQL endpoint as unavailable for the rest of the run (lookups fall back to searches)
+    Args:
+        error (sparql.SparqlError): error of the failed query
+    """
+    global _sparql_available
+    with _sparql_available_lock:
+        if _sparql_available:
+            logger.warning('SPARQL lookup failed (%s), falling back to searches', error)
+        _sparql_available = False
+
+
+def _get_numeric_id(item_id: str) -> int:
+    return int(item_id[1:])
+
+
+def _add_found_item(found: Dict[Tuple[str, str, str], str], key: Tuple[str, str, str], item_id: str):
+    # the oldest item wins if there are several matching items
+    if not found.get(key) or _get_numeric_id(item_id) < _get_numeric_id(found[key]):
+        found[key] = item_id
+
+
+def lookup_items_with_property(keys: Iterable[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], str]:
+    """
+    Finds items with exactly given Polish labels and given property values using as few SPARQL queries
+    as possible (one query per property and item value, or per property for other values, with up to
+    200 labels in each)
+    Args:
+        keys (Iterable[Tuple[str, str, str]]): labels with IDs of the properties and their values
+        (IDs of items or e.g. PRNG IDs)
+    Returns:
+        Dict[Tuple[str, str, str], str]: IDs of found items for all given keys (empty strings for not found
+        and for keys without a label or a value, which are not queried)
+    Raises:
+        sparql.SparqlError: if the SPARQL endpoint is not available
+    """
+    labels_by_item_value: Dict[Tuple[str, str], List[str]] = collections.defaultdict(list)
+    pairs_by_property: Dict[str, List[Tuple[str, str]]] = collections.defaultdict(list)
+    found = {}
+    for label, prop_id, prop_value_id in keys:
+        if (label, prop_id, prop_value_id) in found:
+            continue
+        found[(label, prop_id, prop_value_id)] = ''
+        if not label or not prop_value_id:
+            continue
+        if ITEM_ID_PATTERN.fullmatch(prop_value_id):
+            labels_by_item_value[(prop_id, prop_value_id)].append(label)
+        else:
+            pairs_by_property[prop_id].append((label, prop_value_id))
+
+    for (prop_id, prop_value_id), labels in labels_by_item_value.items():
+        for i in range(0, len(labels), SPARQL_CHUNK_SIZE):
+            values = ' '.join(f'"{sparql.escape(label)}"@pl' for label in labels[i:i + SPARQL_CHUNK_SIZE])
+            query = (f"SELECT ?item ?label WHERE {{ VALUES ?label {{ {values} }} "
+                     f"?item rdfs:label ?label ; wdt:{prop_id} wd:{prop_value_id} . }}")
+            for binding in sparql.run_query(query):
+                _add_found_item(found, (binding['label']['value'], prop_id, prop_value_id), sparql.get_entity_id(binding))
+
+    for prop_id, pairs in pairs_by_property.items():
+        for i in range(0, len(pairs), SPARQL_CHUNK_SIZE):
+            values = ' '.join(f'("{sparql.escape(label)}"@pl "{sparql.escape(value)}")'
+                              for label, value in pairs[i:i + SPARQL_CHUNK_SIZE])
+            query = (f"SELECT ?item ?label ?value WHERE {{ VALUES (?label ?value) {{ {values} }} "
+                     f"?item rdfs:label ?label ; wdt:{prop_id} ?value . }}")
+            for binding in sparql.run_query(query):
+                _add_found_item(found, (binding['label']['value'], prop_id, binding['value']['value']),
+                                sparql.get_entity_id(binding))
+    return found
+
+
+def lookup_item_with_property(label: str, prop_id: str, prop_value_id: str) -> str:
+    """
+    Finds the item with exactly given Polish label and given property value with one SPARQL query
+    Args:
+        label (str): label of the item in Polish
+        prop_id (str): ID of the property
+        prop_value_id (str): value of the property (ID of the item or e.g. PRNG ID)
+    Returns:
+        str: ID of the item or an empty string
+    Raises:
+        sparql.SparqlError: if the SPARQL endpoint is not available
+    """
+    return lookup_items_with_property([(label, prop_id, prop_value_id)])[(label, prop_id, prop_value_id)]
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+
+DEFAULT_JOURNAL_PATH = 'cache/import_journal.jsonl'
+
+
+def get_person_key(label: str, description: str) -> str:
+    """
+    Computes stable key of the person (the same label and description identify the same item in Wikibase)
+    Args:
+        label (str): label of the person item
+        description (str): description of the person item
+    Returns:
+        str: key of the person
+    """
+    return hashlib.sha1((label + '\n' + description).encode('utf-8')).hexdigest()
+
+
+class ImportJournal:
+    """
+    Append-only (JSON Lines) journal of imported persons with IDs of their items and written statements,
+    used to resume interrupted imports
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        """
+        Args:
+            path (str): path of the journal file (created if needed)
+        """
+        self.path = path
+        self.records: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line may be truncated if the previous run was killed while writing
+                        continue
+                    self.records[record['key']] = record
+
+    def is_complete(self, key: str) -> bool:
+        """
+        Args:
+            key (str): key of the person
+        Returns:
+            bool: True if the person was completely imported
+        """
+        return key in self.records
+
+    def get_item_id(self, key: str) -> Optional[str]:
+        """
+        Args:
+            key (str): key of the person
+        Returns:
+            Optional[str]: ID of the person item if it was already created
+        """
+        record = self.records.get(key)
+        return record.get('qid') if record is not None else None
+
+    def record(self, key: str, item_id: str, statements: List[str]):
+        """
+        Appends information about the imported person to the journal
+        Args:
+            key (str): key of the person
+            item_id (str): ID of the person item
+            statements (List[str]): signatures of the written statements of the item
+        """
+        record = { 'key': key, 'qid': item_id, 'statements': statements }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self.records[key] = record
+            with open(self.path, 'a', encoding='utf-8') as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
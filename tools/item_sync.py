@@ -0,0 +1,102 @@
+from wikibaseintegrator import entities
+from wikibaseintegrator.models.claims import Claim
+
+import collections
+import logging
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import tools.wb_actions as wb_actions
+
+
+logger = logging.getLogger(__name__)
+
+
+class ItemChanges(NamedTuple):
+    """
+    Result of comparing the existing item with the item built from xml: entity with only changed statements
+    and new aliases (None if there are no changes) and numbers of added, changed and removed statements
+    """
+    item: Optional[entities.item.ItemEntity]
+    added: int
+    changed: int
+    removed: int
+
+
+def _pop_matching(claims: Dict[str, List[Claim]], signature: str) -> Optional[Claim]:
+    matching = claims.get(signature)
+    if not matching:
+        return None
+    return matching.pop(0)
+
+
+def _group_by_signature(claims: Iterable[Claim], include_qualifiers: bool) -> Dict[str, List[Claim]]:
+    grouped = collections.defaultdict(list)
+    for claim in claims:
+        grouped[wb_actions.get_statement_signature(claim, include_qualifiers, include_references=include_qualifiers)].append(claim)
+    return grouped
+
+
+def get_changes(existing_item: entities.item.ItemEntity, new_item: entities.item.ItemEntity,
+                synced_properties: Iterable[str]) -> ItemChanges:
+    """
+    Compares statements of the existing item with statements built from xml (value, qualifiers and references):
+    new statements are added, statements with the same value but different qualifiers or references are
+    changed (they keep their IDs) and statements of synced properties which are not in xml any more are removed;
+    aliases are only added
+    Args:
+        existing_item (entities.item.ItemEntity): item entity read from Wikibase
+        new_item (entities.item.ItemEntity): item entity (without ID) with all statements built from xml
+        synced_properties (Iterable[str]): IDs of properties whose statements missing in xml are removed
+        (statements of other properties are never removed)
+    Returns:
+        ItemChanges: entity to be written and numbers of changes
+    """
+    changes_item = entities.item.ItemEntity(api=existing_item.api)
+    changes_item.id = existing_item.id
+    added = changed = removed = 0
+    synced_properties = set(synced_properties)
+
+    for prop_id in set(existing_item.claims.claims) | set(new_item.claims.claims):
+        existing_claims = [claim for claim in existing_item.claims.claims.get(prop_id, []) if not claim.removed]
+        new_claims = [claim for claim in new_item.claims.claims.get(prop_id, []) if not claim.removed]
+
+        # identical statements are left untouched
+        unmatched_existing = _group_by_signature(existing_claims, include_qualifiers=True)
+        unmatched_new = []
+        for claim in new_claims:
+            signature = wb_actions.get_statement_signature(claim, include_qualifiers=True, include_references=True)
+            if _pop_matching(unmatched_existing, signature) is None:
+                unmatched_new.append(claim)
+        remaining_existing = _group_by_signature((claim for claims in unmatched_existing.values() for claim in claims),
+                                                 include_qualifiers=False)
+
+        for claim in unmatched_new:
+            existing_claim = _pop_matching(remaining_existing, wb_actions.get_statement_signature(claim, include_qualifiers=False))
+            if existing_claim is not None:
+                claim.id = existing_claim.id
+                changed += 1
+            else:
+                added += 1
+            changes_item.claims.claims.setdefault(prop_id, []).append(claim)
+
+        if prop_id in synced_properties:
+            for claims in remaining_existing.values():
+                for claim in claims:
+                    claim.remove()
+                    changes_item.claims.claims.setdefault(prop_id, []).append(claim)
+                    removed += 1
+
+    new_aliases = 0
+    for language, aliases in new_item.aliases.aliases.items():
+        existing_values = [alias.value for alias in existing_item.aliases.get(language) or []]
+        missing_values = [alias.value for alias in aliases if alias.value not in existing_values]
+        if missing_values:
+            # aliases sent for a language replace all its aliases, so the existing ones are sent too
+            changes_item.aliases.set(language=language, values=existing_values + missing_values)
+            new_aliases += len(missing_values)
+
+    if not (added or changed or removed or new_aliases):
+        return ItemChanges(None, 0, 0, 0)
+    logger.debug('Item %s: %d statements added, %d changed, %d removed, %d aliases added',
+                 existing_item.id, added, changed, removed, new_aliases)
+    return ItemChanges(changes_item, added, changed, removed)
@@ -0,0 +1,84 @@
+import time
+from typing import Optional
+
+from tools.sqlite_cache import SqliteCache
+
+
+DEFAULT_CACHE_PATH = 'cache/lookup_cache.sqlite'
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
+
+
+class LookupCache(SqliteCache):
+    """
+    Persistent (SQLite) cache of vocabulary lookups, mapping (label, language, property, value) to
+    the ID of the matching item; negative results are stored as empty IDs with a shorter TTL
+    """
+    TABLE_SCHEMA = ('CREATE TABLE IF NOT EXISTS lookups ('
+                    'label TEXT NOT NULL, language TEXT NOT NULL, property TEXT NOT NULL, value TEXT NOT NULL, '
+                    'item_id TEXT NOT NULL, expires REAL NOT NULL, '
+                    'PRIMARY KEY (label, language, property, value))')
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: int = DEFAULT_TTL,
+                 negative_ttl: int = DEFAULT_NEGATIVE_TTL, refresh: bool = False):
+        """
+        Args:
+            path (str): path of the SQLite database file (created if needed)
+            ttl (int): time to live of positive results in seconds
+            negative_ttl (int): time to live of negative results in seconds
+            refresh (bool): if True, stored entries are ignored (but still overwritten by new results)
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        super().__init__(path, refresh)
+
+    def get(self, label: str, language: str, prop_id: str, value: str) -> Optional[str]:
+        """
+        Returns cached result of the lookup
+        Args:
+            label (str): label of the searched item
+            language (str): language of the label
+            prop_id (str): ID of the property which was checked
+            value (str): value of the property which was checked
+        Returns:
+            Optional[str]: ID of the item, an empty string for a cached negative result or None
+            if there is no valid entry
+        """
+        with self._lock:
+            if not self.refresh:
+                row = self._connection.execute(
+                    'SELECT item_id, expires FROM lookups WHERE label=? AND language=? AND property=? AND value=?',
+                    (label, language, prop_id, value)).fetchone()
+                if row is not None and row[1] > time.time():
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def set(self, label: str, language: str, prop_id: str, value: str, item_id: str):
+        """
+        Stores result of the lookup
+        Args:
+            label (str): label of the searched item
+            language (str): language of the label
+            prop_id (str): ID of the property which was checked
+            value (str): value of the property which was checked
+            item_id (str): ID of the found item or an empty string if nothing was found
+        """
+        ttl = self.ttl if item_id else self.negative_ttl
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?)',
+                (label, language, prop_id, value, item_id or '', time.time() + ttl))
+            self._connection.commit()
+
+    def evict_expired(self) -> int:
+        """
+        Removes expired entries from the database
+        Returns:
+            int: number of removed entries
+        """
+        with self._lock:
+            cursor = self._connection.execute('DELETE FROM lookups WHERE expires <= ?', (time.time(),))
+            self._connection.commit()
+            return cursor.rowcount
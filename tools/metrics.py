@@ -0,0 +1,198 @@
+import bisect
+import collections
+import json
+import threading
+from typing import Dict, List
+
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets (Prometheus style)
+    """
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: 'Histogram'):
+        """
+        Adds observations of other histogram (with the same buckets) to this one
+        """
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def get_cumulative_counts(self) -> List[int]:
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def get_quantile(self, quantile: float) -> float:
+        """
+        Returns:
+            float: upper bound of the bucket containing given quantile
+        """
+        if self.count == 0:
+            return 0.0
+        for upper_bound, cumulative in zip(self.buckets + [float('inf')], self.get_cumulative_counts()):
+            if cumulative >= quantile * self.count:
+                return upper_bound
+        return float('inf')
+
+    def to_json(self) -> dict:
+        return { 'count': self.count, 'sum': round(self.sum, 6),
+                 'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+                 'p50': self.get_quantile(0.5), 'p95': self.get_quantile(0.95), 'p99': self.get_quantile(0.99),
+                 'buckets': dict(zip([str(bucket) for bucket in self.buckets] + ['+Inf'], self.get_cumulative_counts())) }
+
+
+class Metrics:
+    """
+    Counters and latency histograms of API calls (by action) and of imported persons
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all metrics (e.g. in a child process, which inherits metrics of its parent)
+        """
+        self.calls: Dict[str, int] = collections.Counter()
+        self.errors: Dict[str, int] = collections.Counter()
+        self.retries: Dict[str, int] = collections.Counter()
+        self.bytes_sent: Dict[str, int] = collections.Counter()
+        self.bytes_received: Dict[str, int] = collections.Counter()
+        self.latencies: Dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.person_latency = Histogram()
+        self.persons = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other: 'Metrics'):
+        """
+        Adds metrics collected by other instance (e.g. in another process) to this one
+        Args:
+            other (Metrics): metrics to be added
+        """
+        with self._lock:
+            for name in ('calls', 'errors', 'retries', 'bytes_sent', 'bytes_received'):
+                getattr(self, name).update(getattr(other, name))
+            for action, histogram in other.latencies.items():
+                self.latencies[action].merge(histogram)
+            self.person_latency.merge(other.person_latency)
+            self.persons += other.persons
+
+    def record_call(self, action: str, seconds: float, bytes_sent: int, bytes_received: int,
+                    throttled: bool = False, failed: bool = False):
+        """
+        Args:
+            action (str): API action (or 'sparql')
+            seconds (float): duration of the call
+            bytes_sent (int): size of the request body
+            bytes_received (int): size of the response body
+            throttled (bool): True if the server asked to retry later (the call will be repeated)
+            failed (bool): True if the call ended with an error
+        """
+        with self._lock:
+            self.calls[action] += 1
+            self.latencies[action].observe(seconds)
+            self.bytes_sent[action] += bytes_sent
+            self.bytes_received[action] += bytes_received
+            if throttled:
+                self.retries[action] += 1
+            if failed:
+                self.errors[action] += 1
+
+    def record_person(self, seconds: float):
+        """
+        Args:
+            seconds (float): end-to-end time of importing one person
+        """
+        with self._lock:
+            self.persons += 1
+            self.person_latency.observe(seconds)
+
+    def get_summary(self) -> dict:
+        """
+        Returns:
+            dict: all metrics in JSON-serializable form
+        """
+        with self._lock:
+            actions = {}
+            for action in sorted(self.calls):
+                actions[action] = { 'calls': self.calls[action], 'errors': self.errors[action],
+                                    'retries': self.retries[action], 'bytes_sent': self.bytes_sent[action],
+                                    'bytes_received': self.bytes_received[action],
+                                    'latency_s': self.latencies[action].to_json() }
+            total_calls = sum(self.calls.values())
+            return { 'persons': self.persons, 'api_calls': total_calls,
+                     'api_calls_per_person': round(total_calls / self.persons, 3) if self.persons else 0.0,
+                     'actions': actions, 'person_latency_s': self.person_latency.to_json() }
+
+    def write_json(self, path: str):
+        """
+        Args:
+            path (str): path of the JSON file with summary of metrics
+        """
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json.dump(self.get_summary(), json_file, indent=2)
+
+    def write_prometheus(self, path: str):
+        """
+        Writes metrics in Prometheus text exposition format (e.g. for node_exporter textfile collector)
+        Args:
+            path (str): path of the output file
+        """
+        lines = []
+        with self._lock:
+            for name, counter in (('calls', self.calls), ('errors', self.errors), ('retries', self.retries),
+                                  ('bytes_sent', self.bytes_sent), ('bytes_received', self.bytes_received)):
+                lines.append(f'# TYPE wikibase_import_api_{name}_total counter')
+                for action in sorted(counter):
+                    lines.append(f'wikibase_import_api_{name}_total{{action="{action}"}} {counter[action]}')
+            lines.append('# TYPE wikibase_import_api_latency_seconds histogram')
+            for action in sorted(self.latencies):
+                lines += _format_histogram('wikibase_import_api_latency_seconds', self.latencies[action],
+                                           f'action="{action}",')
+            lines.append('# TYPE wikibase_import_persons_total counter')
+            lines.append(f'wikibase_import_persons_total {self.persons}')
+            lines.append('# TYPE wikibase_import_person_latency_seconds histogram')
+            lines += _format_histogram('wikibase_import_person_latency_seconds', self.person_latency, '')
+        with open(path, 'w', encoding='utf-8') as prometheus_file:
+            prometheus_file.write('\n'.join(lines) + '\n')
+
+
+def _format_histogram(name: str, histogram: Histogram, labels: str) -> List[str]:
+    lines = []
+    for upper_bound, cumulative in zip(histogram.buckets + ['+Inf'], histogram.get_cumulative_counts()):
+        lines.append(f'{name}_bucket{{{labels}le="{upper_bound}"}} {cumulative}')
+    labels = labels.rstrip(',')
+    suffix = '{' + labels + '}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {histogram.sum}')
+    lines.append(f'{name}_count{suffix} {histogram.count}')
+    return lines
+
+
+metrics = Metrics()
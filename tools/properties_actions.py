@@ -1,26 +1,19 @@
-from dotenv import load_dotenv
-from wikibaseintegrator import WikibaseIntegrator, entities, wbi_login
+from wikibaseintegrator import entities
 from wikibaseintegrator.models.snaks import Snak
 from wikibaseintegrator.datatypes import Item, MonolingualText, String, Time, URL
 from wikibaseintegrator.wbi_enums import ActionIfExists
-from wikibaseintegrator.wbi_config import config as wbi_config
 
-import os
+import logging
 
 import tools.dates_formatter as dates_formatter
 import tools.wb_actions as wb_actions
 
 
-wbi_config['MEDIAWIKI_API_URL'] = 'https://prunus-208.man.poznan.pl/api.php'
-wbi_config['SPARQL_ENDPOINT_URL'] = 'https://prunus-208.man.poznan.pl/bigdata/sparql'
-wbi_config['WIKIBASE_URL'] = 'https://prunus-208.man.poznan.pl'
+logger = logging.getLogger(__name__)
 
-load_dotenv()
-BOT_NAME = os.environ.get('BOT_NAME')
-BOT_PASSWORD = os.environ.get('BOT_PASSWORD')
-
-login_instance = wbi_login.Login(user=BOT_NAME, password=BOT_PASSWORD)
-wbi = WikibaseIntegrator(login=login_instance)
+# properties of persons filled only from xml; in sync mode (see item_sync) their statements which are not
+# in xml any more are removed ('instance of' is left out, it may have other values added by hand)
+SYNCED_PROPERTIES = ('P184', 'P183', 'P373', 'P27', 'P7', 'P8', 'P54', 'P55', 'P195', 'P9')
 
 
 def add_human(wbi_item: entities.item.ItemEntity):
@@ -30,7 +23,7 @@ def add_human(wbi_item: entities.item.ItemEntity):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
     """
     wbi_item.claims.add([Item(value='Q32', prop_nr='47')])
-    print('Property "instance of" (human) was added')
+    logger.debug('Property "instance of" (human) was added')
 
 
 def add_given_name(wbi_item: entities.item.ItemEntity, given_name: str):
@@ -41,14 +34,9 @@ def add_given_name(wbi_item: entities.item.ItemEntity, given_name: str):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         given_name (str): name 
     """
-    given_name_id = wb_actions.search_for_item_with_property(given_name, 'P47', 'Q987')
-    if not given_name_id:
-        new_given_name_item = wb_actions.add_new_item(given_name, 'imię męskie', 'male given name')
-        new_given_name_item.claims.add([Item(value='Q987', prop_nr='P47')])
-        new_given_name_item.write()
-        given_name_id = new_given_name_item.id        
+    given_name_id = wb_actions.get_or_create_item_with_property(given_name, 'P47', 'Q987', 'imię męskie', 'male given name')
     wbi_item.claims.add([Item(value=given_name_id, prop_nr='P184')], action_if_exists=ActionIfExists.APPEND_OR_REPLACE)
-    print('Property "given name" was added')
+    logger.debug('Property "given name" was added')
 
 
 def add_family_name(wbi_item: entities.item.ItemEntity, family_name: str):
@@ -59,14 +47,9 @@ def add_family_name(wbi_item: entities.item.ItemEntity, family_name: str):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         family_name (str): family name 
     """
-    family_name_id = wb_actions.search_for_item_with_property(family_name, 'P47', 'Q34')
-    if not family_name_id:
-        new_family_name_item = wb_actions.add_new_item(family_name, 'nazwisko', 'family name')
-        new_family_name_item.claims.add([Item(value='Q34', prop_nr='P47')])
-        new_family_name_item.write()
-        family_name_id = new_family_name_item.id        
+    family_name_id = wb_actions.get_or_create_item_with_property(family_name, 'P47', 'Q34', 'nazwisko', 'family name')
     wbi_item.claims.add([Item(value=family_name_id, prop_nr='P183')])
-    print('Property "family name" was added')
+    logger.debug('Property "family name" was added')
  
 
 def add_location_as_string(wbi_item: entities.item.ItemEntity, location_name: str):
@@ -77,7 +60,7 @@ def add_location_as_string(wbi_item: entities.item.ItemEntity, location_name: st
         location_name (str): name of the location
     """
     wbi_item.claims.add([String(value=location_name, prop_nr='P373')])
-    print('Property "called (string)" was added')
+    logger.debug('Property "called (string)" was added')
 
 
 def add_coat_of_arms(wbi_item: entities.item.ItemEntity, coat_of_arms_name: str):
@@ -88,17 +71,53 @@ def add_coat_of_arms(wbi_item: entities.item.ItemEntity, coat_of_arms_name: str)
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         coat_of_arms_name (str): name of the coat of arms
     """
-    coat_of_arms_id = wb_actions.search_for_item_with_property(coat_of_arms_name, 'P47', 'Q53')
-    if not coat_of_arms_id:
-        new_coat_of_arms_item = wb_actions.add_new_item(coat_of_arms_name, 'herb szlachecki', 'coat of arms')
-        new_coat_of_arms_item.claims.add([Item(value='Q53', prop_nr='P47')])
-        new_coat_of_arms_item.write()
-        coat_of_arms_id = new_coat_of_arms_item.id
+    coat_of_arms_id = wb_actions.get_or_create_item_with_property(coat_of_arms_name, 'P47', 'Q53', 'herb szlachecki', 'coat of arms')
     wbi_item.claims.add([Item(value=coat_of_arms_id, prop_nr='P27')])
-    print('Property "coat of arms" was added')
+    logger.debug('Property "coat of arms" was added')
     
     
-# TODO add qualifiers 
+def _get_time_snak(prop_nr: str, time: str, precision) -> Snak:
+    """
+    Builds snak (e.g. qualifier) of type 'time'
+    Args:
+        prop_nr (str): ID of the property
+        time (str): time in Wikibase format '+yyyy-mm-ddT00:00:00Z'
+        precision (WikibaseDatePrecision): precision of the time
+    Returns:
+        Snak: snak with given time
+    """
+    return Snak(snaktype='value', property_number=prop_nr, datavalue=dates_formatter.get_time_datavalue(time, precision),
+                datatype='time')
+
+
+def _get_time_claim(prop_nr: str, point_in_time: str) -> Time | None:
+    """
+    Builds claim of type 'time' from given point in time: exact dates are added as values, 'about' dates 
+    get qualifier 'circa', dates 'after'/'before' and ranges are added as unknown values with qualifiers
+    Args:
+        prop_nr (str): ID of the property
+        point_in_time (str): date with optional additional information
+    Returns:
+        Time | None: claim or None if the date was not recognized
+    """
+    date_value = dates_formatter.parse_date(point_in_time)
+    if not date_value.time:
+        return None
+    if not date_value.qualifier:
+        return Time(time=date_value.time, precision=date_value.precision, prop_nr=prop_nr)
+    if date_value.qualifier == dates_formatter.QUALIFIER_CIRCA:
+        data_value = { 'value': { 'entity-type': 'item', 'numeric-id': int(dates_formatter.CIRCA_ITEM_ID[1:]), 
+                                  'id': dates_formatter.CIRCA_ITEM_ID }, 'type': 'wikibase-entityid' }
+        qualifier_item = [ Snak(snaktype='value', property_number=date_value.qualifier, datavalue=data_value, datatype='wikibase-item') ]
+        return Time(time=date_value.time, precision=date_value.precision, prop_nr=prop_nr, qualifiers=qualifier_item)
+    if date_value.qualifier == dates_formatter.QUALIFIER_RANGE:
+        qualifier_items = [ _get_time_snak(dates_formatter.QUALIFIER_AFTER, date_value.time, date_value.precision),
+                            _get_time_snak(dates_formatter.QUALIFIER_BEFORE, date_value.end_time, date_value.precision) ]
+    else:
+        qualifier_items = [ _get_time_snak(date_value.qualifier, date_value.time, date_value.precision) ]
+    return Time(time=None, precision=date_value.precision, prop_nr=prop_nr, snaktype='somevalue', qualifiers=qualifier_items)
+
+
 def add_date_of_birth(wbi_item: entities.item.ItemEntity, point_in_time: str):
     """
     Retrieves information about exact date, precision and qualifier from given point in time and adds 
@@ -107,12 +126,10 @@ def add_date_of_birth(wbi_item: entities.item.ItemEntity, point_in_time: str):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         point_in_time (str): date of birth with optional additional information 
     """
-    value, precision, qualifier = dates_formatter.get_numeric_value_precision_and_qualifier(point_in_time)
-    wbi_time = dates_formatter.get_wbi_time(value)
-    if not qualifier:
-        wbi_item.claims.add([Time(time=wbi_time, precision=precision, prop_nr='P7')])
-        
-    print('Property "date of birth" was added')
+    claim = _get_time_claim('P7', point_in_time)
+    if claim is not None:
+        wbi_item.claims.add([claim])
+        logger.debug('Property "date of birth" was added')
     
     
 def add_date_of_death(wbi_item: entities.item.ItemEntity, point_in_time: str):
@@ -123,21 +140,10 @@ def add_date_of_death(wbi_item: entities.item.ItemEntity, point_in_time: str):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         point_in_time (str): date of death with optional additional information 
     """
-    value, precision, qualifier = dates_formatter.get_numeric_value_precision_and_qualifier(point_in_time)
-    wbi_time = dates_formatter.get_wbi_time(value)
-    if not qualifier:
-        wbi_item.claims.add([Time(time=wbi_time, precision=precision, prop_nr='P8')])
-    elif qualifier == 'P189':        
-        data_value = { 'value' : {'entity-type': 'item', 'numeric-id': '37979', 'id': 'Q37979'}, 
-                    'type': 'wikibase-entityid' }
-        qualifier_item = [ Snak(snaktype='value', property_number=qualifier, datavalue=data_value, datatype='wikibase-item') ]
-        wbi_item.claims.add([Time(time=wbi_time, precision=precision, prop_nr='P8', qualifiers=qualifier_item)])           
-    elif qualifier == 'P38' or qualifier == 'P39':
-        data_value = { 'value': {'time': wbi_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 9, 
-                    'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'} 
-        qualifier_item = [ Snak(snaktype='value', property_number=qualifier, datavalue=data_value, datatype='time') ]
-        wbi_item.claims.add([Time(time=None, precision=precision, prop_nr='P8', snaktype='somevalue', qualifiers=qualifier_item)])
-    print('Property "date of death" was added')
+    claim = _get_time_claim('P8', point_in_time)
+    if claim is not None:
+        wbi_item.claims.add([claim])
+        logger.debug('Property "date of death" was added')
     
     
 def add_floruit(wbi_item: entities.item.ItemEntity, point_in_time: str):
@@ -148,10 +154,10 @@ def add_floruit(wbi_item: entities.item.ItemEntity, point_in_time: str):
         wbi_item (entities.item.ItemEntity): item entity to which the property is to be added
         point_in_time (str): date with optional additional information 
     """
-    value, precision, qualifier = dates_formatter.get_numeric_value_precision_and_qualifier(point_in_time)
-    wbi_time = dates_formatter.get_wbi_time(value)
-    wbi_item.claims.add([Time(time=wbi_time, precision=precision, prop_nr='P54')])
-    print('Property "floruit" was added')
+    claim = _get_time_claim('P54', point_in_time)
+    if claim is not None:
+        wbi_item.claims.add([claim])
+        logger.debug('Property "floruit" was added')
     
     
 def add_birth_place(wbi_item: entities.item.ItemEntity, place_name: str, prng_id: str):
@@ -165,9 +171,9 @@ def add_birth_place(wbi_item: entities.item.ItemEntity, place_name: str, prng_id
     place_id = wb_actions.search_for_item_with_property(place_name, 'P274', prng_id)
     if place_id:
         wbi_item.claims.add([Item(value=place_id, prop_nr='P55')])
-        print('Property "place of birth" was added')
+        logger.debug('Property "place of birth" was added')
     else:
-        print('Property "place of birth" was not added')
+        logger.debug('Property "place of birth" was not added')
         
 
 def add_stated_as(wbi_item: entities.item.ItemEntity, text: str, language: str):
@@ -180,7 +186,7 @@ def add_stated_as(wbi_item: entities.item.ItemEntity, text: str, language: str):
     """
     reference_URL = [[ URL(value='http://serwerone.nazwa.pl/urzednicy10/', prop_nr='P182') ]]
     wbi_item.claims.add([MonolingualText(text=text, language=language, prop_nr='P195', references=reference_URL)], action_if_exists=ActionIfExists.APPEND_OR_REPLACE)
-    print('Property "stated as" was added')
+    logger.debug('Property "stated as" was added')
     
     
 def add_alias(wbi_item: entities.item.ItemEntity, text: str, language: str):
@@ -192,66 +198,49 @@ def add_alias(wbi_item: entities.item.ItemEntity, text: str, language: str):
         language (str): language of the given text
     """
     wbi_item.aliases.set(language=language, values=text)
-    print('Alias was added')
+    logger.debug('Alias was added')
 
 
 def add_position_held(wbi_item: entities.item.ItemEntity, office: str, start_date: str, end_date: str, date: str):
     qualifier_items = []
-    office_id = wb_actions.check_if_item_exists(office, '')
-    if not office_id:
-        new_office_item = wb_actions.add_new_item(office, 'urząd', 'position')
-        new_office_item.claims.add([Item(value='Q65', prop_nr='47')])        
-        new_office_item.write()
-        office_id = new_office_item.id
+    office_id = wb_actions.get_or_create_item(office, 'urząd', 'position', '47', 'Q65')
     reference_book = Item(value='Q919', prop_nr='P192')
     reference_volume = String(value='2', prop_nr='P232')
     reference_notebook = String(value='2', prop_nr='P343')
     reference_URL = URL(value='http://serwerone.nazwa.pl/urzednicy10/', prop_nr='P182')
     references = [[ reference_book, reference_volume, reference_notebook ], [reference_URL]]
     
-    if start_date is not None and start_date != '':
-        start_time = dates_formatter.get_wbi_time(start_date) 
-        data_value = { 'value': {'time': start_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 9, 
-                    'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'}      
-        qualifier_start = Snak(snaktype='value', property_number='P203', datavalue=data_value, datatype='wikibase-item')
-        qualifier_items.append(qualifier_start)
+    if start_date:
+        start_value = dates_formatter.parse_date(start_date)
+        if start_value.time:
+            qualifier_items.append(_get_time_snak('P203', start_value.time, start_value.precision))
         
-    if end_date is not None and end_date != '':
-        end_time = dates_formatter.get_wbi_time(end_date) 
-        data_value = { 'value': {'time': end_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 9, 
-                    'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'}      
-        qualifier_end = Snak(snaktype='value', property_number='P204', datavalue=data_value, datatype='wikibase-item')
-        qualifier_items.append(qualifier_end)
+    if end_date:
+        end_value = dates_formatter.parse_date(end_date)
+        if end_value.time:
+            qualifier_items.append(_get_time_snak('P204', end_value.time, end_value.precision))
                      
-    if date is not None and date != '':
-        value, precision, qualifier = dates_formatter.get_numeric_value_precision_and_qualifier(date)
-        wbi_time = dates_formatter.get_wbi_time(value)
-        if not qualifier:
-            if 'w.' in date:
-                data_value = { 'value': {'time': wbi_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 7, 
-                  'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'} 
-            else:
-                data_value = { 'value': {'time': wbi_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 9, 
-                  'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'} 
-            qualifier_date = Snak(snaktype='value', property_number='P252', datavalue=data_value, datatype='wikibase-item')
-            qualifier_items.append(qualifier_date)
-        elif qualifier == 'P38' or qualifier == 'P39':
-            data_value = { 'value': {'time': wbi_time, 'timezone': 0, 'before': 0, 'after': 0, 'precision': 9, 
-                        'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}, 'type': 'time'} 
-            qualifier_date = Snak(snaktype='value', property_number=qualifier, datavalue=data_value, datatype='wikibase-item')
-            qualifier_items.append(qualifier_date)
+    if date:
+        date_value = dates_formatter.parse_date(date)
+        if date_value.time and not date_value.qualifier:
+            qualifier_items.append(_get_time_snak('P252', date_value.time, date_value.precision))
+        elif date_value.qualifier in (dates_formatter.QUALIFIER_AFTER, dates_formatter.QUALIFIER_BEFORE):
+            qualifier_items.append(_get_time_snak(date_value.qualifier, date_value.time, date_value.precision))
+        elif date_value.qualifier == dates_formatter.QUALIFIER_RANGE:
+            qualifier_items.append(_get_time_snak(dates_formatter.QUALIFIER_AFTER, date_value.time, date_value.precision))
+            qualifier_items.append(_get_time_snak(dates_formatter.QUALIFIER_BEFORE, date_value.end_time, date_value.precision))
     
     if qualifier_items == []:
         wbi_item.claims.add([Item(value=office_id, prop_nr='P9', references=references)], action_if_exists=ActionIfExists.APPEND_OR_REPLACE)
     else:
         wbi_item.claims.add([Item(value=office_id, prop_nr='P9', qualifiers=qualifier_items, references=references)], action_if_exists=ActionIfExists.APPEND_OR_REPLACE)
     
-    print('Property "position held" was added')
+    logger.debug('Property "position held" was added')
     
     
 def add_described_by_source(wbi_item: entities.item.ItemEntity, source_title: str, pages: str):   
     # source_id = wb_actions.check_if_item_exists(source_title, '')
 
-    print('Property "described_by_source" was added') 
+    logger.debug('Property "described_by_source" was added')
     
     
@@ -0,0 +1,207 @@
+from requests.adapters import HTTPAdapter
+
+import asyncio
+import json
+import threading
+import time
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+from tools.metrics import metrics
+
+
+WRITE_ACTIONS = { 'wbeditentity', 'wbcreateclaim', 'wbsetclaim', 'wbremoveclaims', 'wbsetlabel', 'wbsetdescription',
+                  'wbsetaliases', 'wbsetqualifier', 'wbsetreference', 'wbmergeitems', 'edit' }
+THROTTLE_ERROR_CODES = { 'maxlag', 'ratelimited' }
+
+
+class TokenBucket:
+    """
+    Token bucket with adaptive (AIMD) rate: the rate grows additively after successful requests
+    and is halved when the server signals overload
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float):
+        """
+        Args:
+            rate (float): initial rate (requests per second)
+            min_rate (float): rate never goes below this value
+            max_rate (float): rate never goes above this value
+            increase (float): rate increase after each successful request
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.tokens = 1.0
+        self.paused_until = 0.0
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token if the request may be sent now
+        Returns:
+            float: 0 if the token was taken, otherwise number of seconds to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if now >= self.paused_until and self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0
+            return max(self.paused_until - now, (1.0 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """
+        Blocks until the request may be sent
+        """
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    async def acquire_async(self):
+        """
+        Waits (without blocking the event loop) until the request may be sent
+        """
+        wait = self.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire()
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after: float):
+        """
+        Args:
+            retry_after (float): number of seconds in which no request should be sent
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+class AdaptiveRateLimiter:
+    """
+    Separate adaptive token buckets for read and write requests to the MediaWiki API
+    """
+
+    def __init__(self, read_rate: float = 10.0, write_rate: float = 2.0, max_read_rate: float = 50.0,
+                 max_write_rate: float = 10.0, maxlag: int = 5, default_retry_after: float = 5.0):
+        """
+        Args:
+            read_rate (float): initial rate of read requests (per second)
+            write_rate (float): initial rate of write requests (per second)
+            max_read_rate (float): maximal rate of read requests (per second)
+            max_write_rate (float): maximal rate of write requests (per second)
+            maxlag (int): value of 'maxlag' parameter sent with every request
+            default_retry_after (float): pause (in seconds) after throttling without 'Retry-After' header
+        """
+        self.reads = TokenBucket(read_rate, 0.5, max_read_rate, 0.1)
+        self.writes = TokenBucket(write_rate, 0.1, max_write_rate, 0.05)
+        self.maxlag = maxlag
+        self.default_retry_after = default_retry_after
+
+    def get_bucket(self, is_write: bool) -> TokenBucket:
+        return self.writes if is_write else self.reads
+
+    def get_rates(self) -> Dict[str, float]:
+        """
+        Returns:
+            Dict[str, float]: current effective rates (requests per second) of reads and writes
+        """
+        return { 'read': self.reads.rate, 'write': self.writes.rate }
+
+
+def _get_request_params(request) -> Dict[str, str]:
+    params = { key: values[0] for key, values in parse_qs(urlparse(request.url).query).items() }
+    body = request.body
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            body = None
+    if isinstance(body, str) and 'multipart/form-data' not in request.headers.get('Content-Type', ''):
+        params.update({ key: values[0] for key, values in parse_qs(body).items() })
+    return params
+
+
+def get_api_error(content: bytes, content_type: str) -> dict:
+    """
+    Returns:
+        dict: error returned by MediaWiki API (empty if the response is not an error)
+    """
+    if 'json' not in content_type:
+        return {}
+    try:
+        error = json.loads(content).get('error', {})
+    except (ValueError, AttributeError):
+        return {}
+    return error if isinstance(error, dict) else {}
+
+
+def get_throttle_delay(status_code: int, headers, error: dict) -> float:
+    """
+    Args:
+        status_code (int): HTTP status of the response
+        headers: HTTP headers of the response
+        error (dict): error returned by MediaWiki API (see get_api_error)
+    Returns:
+        float: requested pause in seconds, 0 if the response does not signal overload,
+        -1 if the server did not say how long to wait
+    """
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 1.0)
+        except ValueError:
+            return -1
+    if status_code == 429:
+        return -1
+    if error.get('code') in THROTTLE_ERROR_CODES:
+        return max(float(error['lag']), 1.0) if 'lag' in error else -1
+    return 0
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    HTTP adapter which sends every request through the rate limiter, adds 'maxlag' parameter to API calls
+    and slows down when the server answers with 'maxlag'/'ratelimited' errors or 'Retry-After' header
+    """
+
+    def __init__(self, limiter: AdaptiveRateLimiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        params = _get_request_params(request)
+        is_api_call = 'action' in params
+        if is_api_call and 'maxlag' not in params:
+            if request.method == 'GET' or request.body is None:
+                request.prepare_url(request.url, { 'maxlag': self.limiter.maxlag })
+            elif isinstance(request.body, str) and 'multipart/form-data' not in request.headers.get('Content-Type', ''):
+                request.body = request.body + '&maxlag=' + str(self.limiter.maxlag)
+                request.prepare_content_length(request.body)
+        action = params.get('action') or ('sparql' if 'query' in params else 'other')
+        bucket = self.limiter.get_bucket(action in WRITE_ACTIONS)
+        bucket.acquire()
+        start_time = time.perf_counter()
+        response = super().send(request, **kwargs)
+        duration = time.perf_counter() - start_time
+        error = get_api_error(response.content, response.headers.get('Content-Type', ''))
+        delay = get_throttle_delay(response.status_code, response.headers, error)
+        if delay == 0:
+            bucket.on_success()
+        else:
+            bucket.on_throttle(delay if delay > 0 else self.limiter.default_retry_after)
+        request_body = request.body or b''
+        if isinstance(request_body, str):
+            request_body = request_body.encode('utf-8')
+        metrics.record_call(action, duration, len(request_body), len(response.content), throttled=delay != 0,
+                            failed=delay == 0 and (response.status_code >= 400 or bool(error)))
+        return response
@@ -0,0 +1,110 @@
+from dotenv import load_dotenv
+from wikibaseintegrator import WikibaseIntegrator, wbi_helpers, wbi_login
+from wikibaseintegrator.wbi_config import config as wbi_config
+
+import os
+import threading
+
+from tools.rate_limiter import AdaptiveRateLimiter, RateLimitedAdapter
+
+
+DEFAULT_WIKIBASE_URL = 'https://prunus-208.man.poznan.pl'
+CONNECTION_POOL_SIZE = 32
+
+load_dotenv()
+
+wbi_config['WIKIBASE_URL'] = os.environ.get('WIKIBASE_URL', DEFAULT_WIKIBASE_URL)
+wbi_config['MEDIAWIKI_API_URL'] = os.environ.get('MEDIAWIKI_API_URL', wbi_config['WIKIBASE_URL'] + '/api.php')
+wbi_config['SPARQL_ENDPOINT_URL'] = os.environ.get('SPARQL_ENDPOINT_URL', wbi_config['WIKIBASE_URL'] + '/bigdata/sparql')
+
+rate_limiter = AdaptiveRateLimiter(read_rate=float(os.environ.get('READ_RATE', 10)),
+                                   write_rate=float(os.environ.get('WRITE_RATE', 2)),
+                                   max_read_rate=float(os.environ.get('MAX_READ_RATE', 50)),
+                                   max_write_rate=float(os.environ.get('MAX_WRITE_RATE', 10)),
+                                   maxlag=int(os.environ.get('MAXLAG', 5)))
+
+
+def _mount_adapter(http_session):
+    adapter = RateLimitedAdapter(rate_limiter, pool_connections=CONNECTION_POOL_SIZE, pool_maxsize=CONNECTION_POOL_SIZE)
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+
+
+# anonymous API calls (e.g. searches) and SPARQL queries of wikibaseintegrator use its own shared sessions
+SHARED_SESSION_NAMES = ('default_session', 'helpers_session')
+
+
+def _mount_shared_adapters():
+    for session_name in SHARED_SESSION_NAMES:
+        if hasattr(wbi_helpers, session_name):
+            _mount_adapter(getattr(wbi_helpers, session_name))
+
+
+_mount_shared_adapters()
+
+_login_instance = None
+_wbi = None
+_lock = threading.Lock()
+
+
+def get_login() -> wbi_login.Login:
+    """
+    Returns the shared login to Wikibase (bot credentials are read from BOT_NAME and BOT_PASSWORD);
+    the login is done on first use and its HTTP session (keep-alive connection pool) is reused by all modules
+    Returns:
+        wbi_login.Login: logged in instance
+    """
+    global _login_instance
+    with _lock:
+        if _login_instance is None:
+            login_instance = wbi_login.Login(user=os.environ.get('BOT_NAME'), password=os.environ.get('BOT_PASSWORD'),
+                                             mediawiki_api_url=wbi_config['MEDIAWIKI_API_URL'])
+            _mount_adapter(login_instance.get_session())
+            _login_instance = login_instance
+        return _login_instance
+
+
+def get_wbi() -> WikibaseIntegrator:
+    """
+    Returns the shared WikibaseIntegrator instance (logs in on first use)
+    Returns:
+        WikibaseIntegrator: instance using the shared login
+    """
+    global _wbi
+    login_instance = get_login()
+    with _lock:
+        if _wbi is None:
+            _wbi = WikibaseIntegrator(login=login_instance)
+        return _wbi
+
+
+def refresh_edit_token() -> str:
+    """
+    Fetches new CSRF token (e.g. after 'badtoken' error) and returns it
+    Returns:
+        str: new edit token
+    """
+    login_instance = get_login()
+    with _lock:
+        login_instance.generate_edit_credentials()
+    return login_instance.get_edit_token()
+
+
+def reset():
+    """
+    Forgets the shared login and HTTP connections (e.g. inherited by a child process from its parent),
+    so that the next call logs in again with its own session
+    """
+    global _login_instance, _wbi, _lock
+    _lock = threading.Lock()
+    _login_instance = None
+    _wbi = None
+    _mount_shared_adapters()
+
+
+def get_rates() -> dict:
+    """
+    Returns:
+        dict: current effective rates (requests per second) of reads and writes
+    """
+    return rate_limiter.get_rates()
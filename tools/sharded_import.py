@@ -0,0 +1,116 @@
+from multiprocessing.managers import BaseManager
+
+import logging
+import multiprocessing
+import queue
+import traceback
+from typing import Callable, List
+
+from tools import session
+from tools.metrics import metrics
+import tools.wb_actions as wb_actions
+
+
+logger = logging.getLogger(__name__)
+
+
+class VocabularyCoordinator:
+    """
+    Owner of shared vocabulary items (given names, family names, coats of arms, offices) in sharded mode:
+    it runs in the coordinator process and is the only one which looks them up and creates them, so shards
+    never create duplicates (calls from different shards are served in separate threads)
+    """
+
+    def get_or_create_item_with_property(self, label: str, prop_id: str, prop_value_id: str, description_pl: str,
+                                         description_en: str) -> str:
+        return wb_actions.get_or_create_item_with_property(label, prop_id, prop_value_id, description_pl, description_en)
+
+    def get_or_create_item(self, label: str, description_pl: str, description_en: str, prop_id: str,
+                           prop_value_id: str) -> str:
+        return wb_actions.get_or_create_item(label, description_pl, description_en, prop_id, prop_value_id)
+
+    def get_metrics(self):
+        return metrics
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+
+CoordinatorManager.register('VocabularyCoordinator', VocabularyCoordinator)
+
+
+def reset_process_state():
+    """
+    Drops the state inherited from the parent process (login, HTTP connections, connections of the lookup
+    and entity caches and metrics), so that the process uses its own session
+    """
+    session.reset()
+    wb_actions.lookup_cache.reopen()
+    wb_actions.entity_cache.reopen()
+    metrics.reset()
+
+
+def _run_shard(import_shard: Callable[[int, int], int], shard: int, shards: int, coordinator, results):
+    reset_process_state()
+    wb_actions.vocabulary_coordinator = coordinator
+    result = { 'shard': shard, 'persons': 0, 'error': '' }
+    try:
+        result['persons'] = import_shard(shard, shards)
+    except Exception:
+        logger.exception('Shard %d failed', shard)
+        result['error'] = traceback.format_exc()
+    result['cache_hits'], result['cache_misses'] = wb_actions.lookup_cache.get_stats()
+    result['entity_cache_hits'], result['entity_cache_misses'] = wb_actions.entity_cache.get_stats()
+    result['rates'] = session.get_rates()
+    result['metrics'] = metrics
+    results.put(result)
+
+
+def run_shards(processes: int, import_shard: Callable[[int, int], int]) -> List[dict]:
+    """
+    Imports persons in given number of processes (shards), each with its own login to Wikibase; shared
+    vocabulary items are created only by the coordinator process, persons are assigned to shards by their
+    labels and descriptions (see xml_parser.get_person_shard), so every person item is created by one shard;
+    metrics of all shards are merged into the metrics of this process
+    Args:
+        processes (int): number of shard processes
+        import_shard (Callable[[int, int], int]): function which imports persons of the shard (called with
+        the number of the shard and the number of all shards) and returns the number of imported persons
+    Returns:
+        List[dict]: results of shards (number of persons, error, cache statistics and request rates), by shard
+    """
+    context = multiprocessing.get_context('fork')
+    manager = CoordinatorManager(ctx=context)
+    manager.start(initializer=reset_process_state)
+    coordinator = manager.VocabularyCoordinator()
+    results = context.Queue()
+    shard_processes = [context.Process(target=_run_shard, args=(import_shard, shard, processes, coordinator, results),
+                                       name='shard-' + str(shard)) for shard in range(processes)]
+    for shard_process in shard_processes:
+        shard_process.start()
+
+    shard_results = []
+    while len(shard_results) < processes:
+        try:
+            shard_results.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(shard_process.is_alive() for shard_process in shard_processes) and results.empty():
+                break
+    for shard_process in shard_processes:
+        shard_process.join()
+    metrics.merge(coordinator.get_metrics())
+    manager.shutdown()
+
+    finished_shards = { result['shard'] for result in shard_results }
+    for shard, shard_process in enumerate(shard_processes):
+        if shard not in finished_shards:
+            logger.error('Shard %d exited with code %s without results', shard, shard_process.exitcode)
+            shard_results.append({ 'shard': shard, 'persons': 0, 'error': 'exit code ' + str(shard_process.exitcode),
+                                   'cache_hits': 0, 'cache_misses': 0, 'entity_cache_hits': 0, 'entity_cache_misses': 0,
+                                   'rates': {}, 'metrics': None })
+    for result in shard_results:
+        shard_metrics = result.pop('metrics')
+        if shard_metrics is not None:
+            metrics.merge(shard_metrics)
+    return sorted(shard_results, key=lambda result: result['shard'])
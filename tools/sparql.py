@@ -0,0 +1,58 @@
+from wikibaseintegrator import wbi_helpers
+from wikibaseintegrator.wbi_config import config as wbi_config
+import requests
+
+
+class SparqlError(Exception):
+    pass
+
+
+def get_prefix() -> str:
+    """
+    Returns:
+        str: SPARQL prefixes of the configured Wikibase (wd, wdt, p, ps, pq, psv, wikibase, rdfs)
+    """
+    wikibase_url = wbi_config['WIKIBASE_URL']
+    return (f"PREFIX wd: <{wikibase_url}/entity/>\n"
+            f"PREFIX wdt: <{wikibase_url}/prop/direct/>\n"
+            f"PREFIX p: <{wikibase_url}/prop/>\n"
+            f"PREFIX ps: <{wikibase_url}/prop/statement/>\n"
+            f"PREFIX pq: <{wikibase_url}/prop/qualifier/>\n"
+            f"PREFIX psv: <{wikibase_url}/prop/statement/value/>\n"
+            "PREFIX wikibase: <http://wikiba.se/ontology#>\n"
+            "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>\n")
+
+
+def escape(text: str) -> str:
+    """
+    Escapes the text to be used as a string literal in a query
+    """
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def run_query(query: str) -> list:
+    """
+    Sends the query (with prefixes of the configured Wikibase) to the SPARQL endpoint
+    Args:
+        query (str): SPARQL query without prefixes
+    Returns:
+        list: result bindings
+    Raises:
+        SparqlError: if the endpoint is not available or its response is not a valid result
+    """
+    try:
+        result = wbi_helpers.execute_sparql_query(query=query, prefix=get_prefix(), endpoint=wbi_config['SPARQL_ENDPOINT_URL'])
+        return result['results']['bindings']
+    except (requests.RequestException, ValueError, KeyError) as e:
+        raise SparqlError(f'{type(e).__name__}: {e}') from e
+
+
+def get_entity_id(binding: dict, variable: str = 'item') -> str:
+    """
+    Args:
+        binding (dict): result binding
+        variable (str): name of the variable with entity URI
+    Returns:
+        str: ID of the entity (last part of its URI)
+    """
+    return binding[variable]['value'].rsplit('/', 1)[-1]
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+from typing import Tuple
+
+
+SQLITE_TIMEOUT = 30
+
+
+class SqliteCache:
+    """
+    Base of persistent (SQLite) caches: one connection shared by threads of the process (guarded by a lock),
+    the table is created if needed; subclasses define its schema (TABLE_SCHEMA) and count hits and misses
+    """
+    TABLE_SCHEMA = ''
+
+    def __init__(self, path: str, refresh: bool = False):
+        """
+        Args:
+            path (str): path of the SQLite database file (created if needed)
+            refresh (bool): if True, stored entries are ignored (but still overwritten by new entries)
+        """
+        self.path = path
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # other processes (sharded import) may write to the same database, so wait for their locks
+        connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        connection.execute(self.TABLE_SCHEMA)
+        connection.commit()
+        return connection
+
+    def reopen(self):
+        """
+        Opens new connection to the database and resets statistics (e.g. in a child process, which must not
+        use the connection inherited from its parent)
+        """
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> Tuple[int, int]:
+        """
+        Returns:
+            Tuple[int, int]: number of cache hits and misses in this run
+        """
+        return self.hits, self.misses
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
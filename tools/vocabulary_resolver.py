@@ -0,0 +1,128 @@
+from wikibaseintegrator.datatypes import Item
+
+from typing import Dict, Iterable, Set
+import logging
+
+from tools.xml_parser import Person
+from tools import exact_lookup, sparql
+import tools.dates_formatter as dates_formatter
+import tools.wb_actions as wb_actions
+
+
+logger = logging.getLogger(__name__)
+
+# category: (property ID, value ID) used by properties_actions for the vocabulary items
+CATEGORY_PROPERTIES = {
+    'given_names': ('P47', 'Q987'),
+    'family_names': ('P47', 'Q34'),
+    'coats_of_arms': ('P47', 'Q53'),
+}
+
+# category: (Polish description, English description) of new vocabulary items
+CATEGORY_DESCRIPTIONS = {
+    'given_names': ('imię męskie', 'male given name'),
+    'family_names': ('nazwisko', 'family name'),
+    'coats_of_arms': ('herb szlachecki', 'coat of arms'),
+    'offices': ('urząd', 'position'),
+}
+
+
+def collect_vocabulary(persons: Iterable[Person]) -> Dict[str, Set]:
+    """
+    Collects distinct vocabulary values (given names, family names, coats of arms, offices and places
+    of birth with PRNG IDs) and texts of dates from given data about persons
+    Args:
+        persons (Iterable[Person]): records with all data about persons
+    Returns:
+        Dict[str, Set]: sets of distinct values by category; places are (name, PRNG ID) tuples, dates
+        (category 'dates') are not vocabulary items, they are normalised with dates_formatter.normalise_dates
+    """
+    vocabulary = { 'given_names': set(), 'family_names': set(), 'coats_of_arms': set(),
+                   'offices': set(), 'places': set(), 'dates': set() }
+    for person in persons:
+        if person.name is not None:
+            vocabulary['given_names'].update(person.name.split())
+        if person.surname is not None:
+            vocabulary['family_names'].add(person.surname)
+        if person.coat_of_arms is not None and 'nieznany' not in person.coat_of_arms:
+            vocabulary['coats_of_arms'].add(person.coat_of_arms)
+        for position in person.positions:
+            vocabulary['offices'].add(position.office)
+        # places are identified by their PRNG IDs, so places without them are not looked up
+        if person.place_of_birth and person.place_of_birth_prng:
+            vocabulary['places'].add((person.place_of_birth, person.place_of_birth_prng))
+        vocabulary['dates'].update(dates_formatter.get_person_date_texts(person))
+    return vocabulary
+
+
+def _resolve_labels(labels: Set[str]) -> Dict[str, str]:
+    found = {}
+    labels_list = sorted(labels)
+    for i in range(0, len(labels_list), exact_lookup.SPARQL_CHUNK_SIZE):
+        values = ' '.join(f'"{sparql.escape(label)}"@pl' for label in labels_list[i:i + exact_lookup.SPARQL_CHUNK_SIZE])
+        query = f"SELECT ?item ?label WHERE {{ VALUES ?label {{ {values} }} ?item rdfs:label ?label . }}"
+        for binding in sparql.run_query(query):
+            found.setdefault(binding['label']['value'], sparql.get_entity_id(binding))
+    return found
+
+
+def preresolve_vocabulary(vocabulary: Dict[str, Set]) -> int:
+    """
+    Resolves all collected vocabulary values with a few large SPARQL queries and stores the results
+    (including values which do not exist yet) in the in-memory map used by wb_actions lookups;
+    if SPARQL endpoint is unavailable, the values are resolved one by one with batched searches
+    Args:
+        vocabulary (Dict[str, Set]): sets of distinct values by category (see collect_vocabulary)
+    Returns:
+        int: number of values which were found in Wikibase
+    """
+    try:
+        keys = [(label, prop_id, prop_value_id) for category, (prop_id, prop_value_id) in CATEGORY_PROPERTIES.items()
+                for label in vocabulary[category]]
+        keys += [(name, 'P274', prng) for name, prng in vocabulary['places']]
+        found = exact_lookup.lookup_items_with_property(keys)
+        for key, item_id in found.items():
+            wb_actions.set_known_item_id(*key, item_id)
+        resolved = sum(bool(item_id) for item_id in found.values())
+        found = _resolve_labels(vocabulary['offices'])
+        for label in vocabulary['offices']:
+            wb_actions.set_known_item_id(label, 'description', '', found.get(label, ''))
+        resolved += len(found)
+        return resolved
+    except sparql.SparqlError as e:
+        exact_lookup.disable_sparql(e)
+    resolved = 0
+    for category, (prop_id, prop_value_id) in CATEGORY_PROPERTIES.items():
+        for label in vocabulary[category]:
+            resolved += bool(wb_actions.search_for_item_with_property(label, prop_id, prop_value_id))
+    for label in vocabulary['offices']:
+        resolved += bool(wb_actions.check_if_item_exists(label, ''))
+    for name, prng in vocabulary['places']:
+        resolved += bool(wb_actions.search_for_item_with_property(name, 'P274', prng))
+    return resolved
+
+
+def create_missing_vocabulary(vocabulary: Dict[str, Set]) -> int:
+    """
+    Creates (one edit per item) all vocabulary items which were not found during pre-resolution,
+    so that importing persons does not interleave item creation with person edits
+    Args:
+        vocabulary (Dict[str, Set]): sets of distinct values by category (see collect_vocabulary)
+    Returns:
+        int: number of created items
+    """
+    created = 0
+    for category, (prop_id, prop_value_id) in CATEGORY_PROPERTIES.items():
+        description_pl, description_en = CATEGORY_DESCRIPTIONS[category]
+        for label in sorted(vocabulary[category]):
+            if wb_actions.get_known_item_id(label, prop_id, prop_value_id) == '':
+                wb_actions.add_new_item(label, description_pl, description_en,
+                                        claims=[Item(value=prop_value_id, prop_nr=prop_id)], check_existing=False)
+                created += 1
+    description_pl, description_en = CATEGORY_DESCRIPTIONS['offices']
+    for label in sorted(vocabulary['offices']):
+        if wb_actions.get_known_item_id(label, 'description', '') == '':
+            wb_actions.add_new_item(label, description_pl, description_en, claims=[Item(value='Q65', prop_nr='47')],
+                                    check_existing=False)
+            created += 1
+    return created
@@ -1,37 +1,340 @@
-from dotenv import load_dotenv
-from wikibaseintegrator import WikibaseIntegrator, entities, wbi_helpers, wbi_login
-from wikibaseintegrator.wbi_config import config as wbi_config
+from wikibaseintegrator import entities, wbi_helpers
+from wikibaseintegrator.datatypes import BaseDataType, Item
+from wikibaseintegrator.models.claims import Claim
+from wikibaseintegrator.wbi_exceptions import MWApiError
 
+import itertools
+import json
+import logging
 import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+from tools import exact_lookup, session, sparql
+from tools.entity_cache import EntityCache, DEFAULT_ENTITY_CACHE_PATH, DEFAULT_MEMORY_SIZE
+from tools.lookup_cache import LookupCache, DEFAULT_CACHE_PATH, DEFAULT_TTL, DEFAULT_NEGATIVE_TTL
 
-wbi_config['MEDIAWIKI_API_URL'] = 'https://prunus-208.man.poznan.pl/api.php'
-wbi_config['SPARQL_ENDPOINT_URL'] = 'https://prunus-208.man.poznan.pl/bigdata/sparql'
-wbi_config['WIKIBASE_URL'] = 'https://prunus-208.man.poznan.pl'
 
-load_dotenv()
-BOT_NAME = os.environ.get('BOT_NAME')
-BOT_PASSWORD = os.environ.get('BOT_PASSWORD')
+logger = logging.getLogger(__name__)
 
-login_instance = wbi_login.Login(user=BOT_NAME, password=BOT_PASSWORD)
-wbi = WikibaseIntegrator(login=login_instance)
+lookup_cache = LookupCache(path=os.environ.get('LOOKUP_CACHE_PATH', DEFAULT_CACHE_PATH),
+                           ttl=int(os.environ.get('LOOKUP_CACHE_TTL', DEFAULT_TTL)),
+                           negative_ttl=int(os.environ.get('LOOKUP_CACHE_NEGATIVE_TTL', DEFAULT_NEGATIVE_TTL)))
 
+entity_cache = EntityCache(path=os.environ.get('ENTITY_CACHE_PATH', DEFAULT_ENTITY_CACHE_PATH),
+                           memory_size=int(os.environ.get('ENTITY_CACHE_MEMORY_SIZE', DEFAULT_MEMORY_SIZE)))
 
-def check_if_item_exists(label: str, description: str) -> str: 
+preresolved_items: Dict[Tuple[str, str, str], str] = {}
+
+_key_locks: Dict[tuple, threading.RLock] = {}
+_key_locks_guard = threading.Lock()
+
+INSTANCE_OF_PROPERTY = 'P47'
+
+# language of labels and descriptions fetched for lookups (see get_item_summaries)
+SUMMARY_LANGUAGE = 'pl'
+
+BULK_CHUNK_SIZE = 50
+BULK_CHUNK_SIZE_HIGH_LIMITS = 500
+_bulk_chunk_size = None
+
+# in offline (dry-run) mode nothing is sent to Wikibase, unknown items get placeholder IDs from this range
+PLACEHOLDER_ID_START = 1000000000
+offline = False
+planned_items: List[dict] = []
+_placeholder_ids = itertools.count(PLACEHOLDER_ID_START)
+_first_placeholder_id = PLACEHOLDER_ID_START
+
+# in export mode new items get IDs from the reserved range and are written to the dump instead of Wikibase
+dump_writer = None
+
+# in sharded mode (see sharded_import) shared vocabulary items are looked up and created only by the coordinator
+vocabulary_coordinator = None
+
+
+def enable_offline_mode():
+    """
+    Switches to offline (dry-run) mode: lookups are answered only from the in-memory map and the lookup cache
+    (unknown values are treated as not existing), new items get placeholder IDs and are collected in
+    'planned_items' instead of being written
+    """
+    global offline
+    offline = True
+
+
+def enable_export_mode(writer, first_id: int):
+    """
+    Switches to export mode: lookups are sent to Wikibase as usual, but new items get IDs from the range 
+    reserved for the dump (starting with given number) and are written by the dump writer instead of Wikibase
+    Args:
+        writer (dump_writer.DumpWriter): writer of the dump
+        first_id (int): first number of the reserved range of item IDs
+    """
+    global dump_writer, _placeholder_ids, _first_placeholder_id
+    dump_writer = writer
+    _placeholder_ids = itertools.count(first_id)
+    _first_placeholder_id = first_id
+
+
+def is_placeholder_id(item_id: str) -> bool:
+    return bool(item_id) and int(item_id[1:]) >= _first_placeholder_id
+
+
+def new_item_entity() -> entities.item.ItemEntity:
+    if offline:
+        return entities.item.ItemEntity()
+    return session.get_wbi().item.new()
+
+
+def get_key_lock(key: tuple) -> threading.RLock:
+    """
+    Returns the lock assigned to given key (e.g. label with property and value of the vocabulary item), 
+    so that only one worker at a time looks up and creates the item for the same key; the lock is reentrant, 
+    so the caller may hold it from the lookup until the item is written (see add_new_item with write=False)
+    Args:
+        key (tuple): key identifying the item
+    Returns:
+        threading.RLock: lock for the key
+    """
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.RLock()
+        return lock
+
+
+def get_known_item_id(label: str, prop_id: str, prop_value_id: str) -> Optional[str]:
+    """
+    Returns the ID of the item with given label and property value if it is already known (pre-resolved
+    in this run or stored in the lookup cache)
+    Args:
+        label (str): label of the item in Polish
+        prop_id (str): ID of the property ('description' for lookups by description)
+        prop_value_id (str): value of the property
+    Returns:
+        Optional[str]: ID of the item, an empty string if it is known not to exist or None if unknown 
+    """
+    key = (label, prop_id, prop_value_id)
+    if key in preresolved_items:
+        return preresolved_items[key]
+    cached_id = lookup_cache.get(label, 'pl', prop_id, prop_value_id)
+    if cached_id is None and offline:
+        return ''
+    return cached_id
+
+
+def set_known_item_id(label: str, prop_id: str, prop_value_id: str, item_id: str):
+    """
+    Stores the result of the lookup in the in-memory map and in the lookup cache; in export mode it is
+    stored only in memory, because items in the dump do not exist in Wikibase until the dump is loaded;
+    nothing is stored for a missing label or value
+    Args:
+        label (str): label of the item in Polish
+        prop_id (str): ID of the property ('description' for lookups by description)
+        prop_value_id (str): value of the property
+        item_id (str): ID of the item or an empty string if it does not exist
+    """
+    if label is None or prop_value_id is None:
+        return
+    preresolved_items[(label, prop_id, prop_value_id)] = item_id
+    if dump_writer is None and not is_placeholder_id(item_id):
+        lookup_cache.set(label, 'pl', prop_id, prop_value_id, item_id)
+
+
+def _get_bulk_chunk_size() -> int:
+    """
+    Checks (once) if the logged in user has 'apihighlimits' right and returns the maximal number 
+    of IDs allowed in one 'wbgetentities' call
+    Returns:
+        int: 500 with 'apihighlimits' right, 50 otherwise
+    """
+    global _bulk_chunk_size
+    if _bulk_chunk_size is None:
+        try:
+            result = wbi_helpers.mediawiki_api_call_helper(data={'action': 'query', 'meta': 'userinfo', 'uiprop': 'rights',
+                                                                 'format': 'json'}, login=session.get_login())
+            rights = result['query']['userinfo'].get('rights', [])
+            _bulk_chunk_size = BULK_CHUNK_SIZE_HIGH_LIMITS if 'apihighlimits' in rights else BULK_CHUNK_SIZE
+        except Exception:
+            _bulk_chunk_size = BULK_CHUNK_SIZE
+    return _bulk_chunk_size
+
+
+def _iter_entities_json(ids: List[str], params: Optional[dict] = None) -> Iterator[Tuple[str, dict]]:
+    unique_ids = list(dict.fromkeys(ids))
+    chunk_size = _get_bulk_chunk_size()
+    for i in range(0, len(unique_ids), chunk_size):
+        chunk = unique_ids[i:i + chunk_size]
+        data = dict(params or {}, action='wbgetentities', ids='|'.join(chunk), format='json')
+        result = wbi_helpers.mediawiki_api_call_helper(data=data, login=session.get_login(), allow_anonymous=True)
+        for entity_id, entity_json in result.get('entities', {}).items():
+            if 'missing' not in entity_json:
+                yield entity_id, entity_json
+
+
+def revalidate_entity_cache(ids: Optional[Iterable[str]] = None) -> Tuple[int, int]:
+    """
+    Checks entities cached in previous runs by asking only for their revision IDs ('wbgetentities' with
+    'props=info', in chunks like get_items_bulk): unchanged entities are used in this run, changed
+    and deleted ones are removed from the cache (and fetched again when needed)
+    Args:
+        ids (Optional[Iterable[str]]): IDs of the entities to be checked (all unchecked entries if None)
+    Returns:
+        Tuple[int, int]: numbers of unchanged and removed entries
+    """
+    unchecked = entity_cache.get_unchecked(ids)
+    if not unchecked:
+        return 0, 0
+    current_revisions = { entity_id: int(entity_json['lastrevid']) 
+                          for entity_id, entity_json in _iter_entities_json(list(unchecked), { 'props': 'info' }) }
+    unchanged = [entity_id for entity_id, lastrevid in unchecked.items() if current_revisions.get(entity_id) == lastrevid]
+    entity_cache.mark_checked(unchanged)
+    entity_cache.remove(entity_id for entity_id in unchecked if current_revisions.get(entity_id) != unchecked[entity_id])
+    return len(unchanged), len(unchecked) - len(unchanged)
+
+
+def get_items_bulk(ids: List[str]) -> Dict[str, entities.item.ItemEntity]:
+    """
+    Gets items with given IDs from the entity cache (entries of previous runs are checked first, see
+    revalidate_entity_cache) and the remaining ones from Wikibase using as few 'wbgetentities' calls 
+    as possible (chunks of 50 IDs, or 500 with 'apihighlimits' right)
+    Args:
+        ids (List[str]): IDs of the items (duplicates are fetched once)
+    Returns:
+        Dict[str, entities.item.ItemEntity]: existing item entities by ID (missing items are omitted)
+    """
+    entities_json = {}
+    unique_ids = list(dict.fromkeys(ids))
+    revalidate_entity_cache(unique_ids)
+    for entity_id in unique_ids:
+        entity_json = entity_cache.get(entity_id)
+        if entity_json is not None:
+            entities_json[entity_id] = entity_json
+    for entity_id, entity_json in _iter_entities_json([entity_id for entity_id in unique_ids if entity_id not in entities_json]):
+        entity_cache.set(entity_json)
+        entities_json[entity_id] = entity_json
+    return { entity_id: new_item_entity().from_json(entity_json) for entity_id, entity_json in entities_json.items() }
+
+
+def get_item(item_id: str) -> entities.item.ItemEntity:
+    """
+    Args:
+        item_id (str): ID of the item
+    Returns:
+        entities.item.ItemEntity: item entity (see get_items_bulk)
+    Raises:
+        ValueError: if the item does not exist
+    """
+    items = get_items_bulk([item_id])
+    if item_id not in items:
+        raise ValueError('Item ' + item_id + ' does not exist')
+    return items[item_id]
+
+
+def get_datavalue_id(datavalue: Optional[dict]):
+    """
+    Args:
+        datavalue (Optional[dict]): datavalue of the snak in JSON
+    Returns:
+        value of the snak (ID for item values)
+    """
+    value = (datavalue or {}).get('value')
+    if isinstance(value, dict) and value.get('entity-type') == 'item':
+        return value['id']
+    return value
+
+
+class ItemSummary:
+    """
+    Parts of an item needed by lookups: Polish label and description and values of selected properties
+    (IDs for item values), see get_item_summaries
+    """
+    __slots__ = ('id', 'label', 'description', 'claims')
+
+    def __init__(self, item_id: str, label: Optional[str], description: Optional[str], claims: Dict[str, list]):
+        self.id = item_id
+        self.label = label
+        self.description = description
+        self.claims = claims
+
+    def has_property_value(self, prop_id: str, prop_value_id: str) -> bool:
+        """
+        Args:
+            prop_id (str): ID of the property
+            prop_value_id (str): value of the property (ID for item values)
+        Returns:
+            bool: True if any statement of the item with given property has given value
+        """
+        return prop_value_id in self.claims.get(prop_id, ())
+
+
+def get_summary_params(props: Iterable[str] = ()) -> dict:
+    """
+    Args:
+        props (Iterable[str]): IDs of the properties whose values are needed
+    Returns:
+        dict: parameters of 'wbgetentities' which limit the response to Polish labels and descriptions
+        (and statements, if any properties are needed)
+    """
+    return { 'props': 'labels|descriptions|claims' if props else 'labels|descriptions', 'languages': SUMMARY_LANGUAGE }
+
+
+def parse_item_summary(entity_json: dict, props: Iterable[str] = ()) -> ItemSummary:
+    """
+    Args:
+        entity_json (dict): entity from 'wbgetentities' response (see get_summary_params)
+        props (Iterable[str]): IDs of the properties whose values are needed
+    Returns:
+        ItemSummary: summary of the item (statements of other properties are not parsed)
+    """
+    label = entity_json.get('labels', {}).get(SUMMARY_LANGUAGE, {}).get('value')
+    description = entity_json.get('descriptions', {}).get(SUMMARY_LANGUAGE, {}).get('value')
+    claims_json = entity_json.get('claims', {})
+    claims = { prop_id: [get_datavalue_id(claim['mainsnak'].get('datavalue')) for claim in claims_json.get(prop_id, [])]
+               for prop_id in props }
+    return ItemSummary(entity_json['id'], label, description, claims)
+
+
+def get_item_summaries(ids: List[str], props: Iterable[str] = ()) -> Dict[str, ItemSummary]:
+    """
+    Gets only Polish labels and descriptions (and values of given properties) of items with given IDs,
+    which is much less data to download and parse than complete items (see get_items_bulk)
+    Args:
+        ids (List[str]): IDs of the items (duplicates are fetched once)
+        props (Iterable[str]): IDs of the properties whose values are needed
+    Returns:
+        Dict[str, ItemSummary]: summaries of existing items by ID (missing items are omitted)
+    """
+    props = list(props)
+    return { entity_id: parse_item_summary(entity_json, props)
+             for entity_id, entity_json in _iter_entities_json(ids, get_summary_params(props)) }
+
+
+def check_if_item_exists(label: str, description: str, remember_missing: bool = True) -> str: 
     """ 
     Checks if the item with given label and description exists in Wikibase
     Args:
         label (str): label of the item in Polish
         description (str): description of the item in Polish
+        remember_missing (bool): if False, the negative result is not stored (the caller is about to create
+        the item, which registers its ID, see remember_new_item)
     Returns:
         str: ID of the existing item or an empty string 
     """
+    cached_id = get_known_item_id(label, 'description', description)
+    if cached_id is not None:
+        return cached_id
     result = wbi_helpers.search_entities(search_string=label, language='pl')
+    items = get_item_summaries(result)
     for existing_entity_id in result:
-        wbi_item = wbi.item.get(entity_id=existing_entity_id)
-        existing_entity_description = wbi_item.descriptions.get(language='pl')
-        if (existing_entity_description == description) or (len(description) == 0):
+        item_summary = items.get(existing_entity_id)
+        if item_summary is None:
+            continue
+        if (item_summary.description == description) or (len(description) == 0):
+            set_known_item_id(label, 'description', description, existing_entity_id)
             return existing_entity_id
+    if remember_missing:
+        set_known_item_id(label, 'description', description, '')
     return ''
 
 
@@ -44,39 +347,212 @@ def check_if_item_exists_by_ID(id: str) -> entities.item.ItemEntity | str:
         str: existing item entity or an empty string 
     """
     try: 
-        item_entity = wbi.item.get(entity_id=id)
+        item_entity = get_item(id)
         return item_entity
     except:
         return ''
 
 
-def add_new_item(label_pl: str, description_pl: str, description_en: str) -> entities.item.ItemEntity: 
+def add_new_item(label_pl: str, description_pl: str, description_en: str, claims: Optional[List[BaseDataType]] = None,
+                 write: bool = True, check_existing: bool = True) -> entities.item.ItemEntity: 
     """ 
     Checks if the item with given label and description (both in Polish) exists in Wikibase, if not 
-    then adds it
+    then adds it (with labels, descriptions and given claims in one edit); with write=False the caller
+    should hold get_key_lock((label_pl, 'description', description_pl)) until the new item is written,
+    so that the same item is not created twice
     Args:
         label (str): label of the item in Polish
         description_pl (str): description of the item in Polish
         description_en (str): description of the item in English
+        claims (Optional[List[BaseDataType]]): claims to be added to the new item 
+        write (bool): if False, the new item is not written to Wikibase (see write_item)
+        check_existing (bool): if False, the item is created without checking (the caller has just looked
+        it up, e.g. by its label and class)
     Returns:
         entities.item.ItemEntity: added item entity or existing item entity
     """
-    potential_item_id = check_if_item_exists(label=label_pl, description=description_pl) 
-    if not potential_item_id:
-        wbi_new_item = wbi.item.new()
-        wbi_new_item.labels.set(language='pl', value=label_pl)
-        wbi_new_item.labels.set(language='en', value=label_pl)
+    with get_key_lock((label_pl, 'description', description_pl)):
+        potential_item_id = (check_if_item_exists(label=label_pl, description=description_pl, remember_missing=False)
+                             if check_existing else '')
+        if not potential_item_id:
+            wbi_new_item = new_item_entity()
+            wbi_new_item.labels.set(language='pl', value=label_pl)
+            wbi_new_item.labels.set(language='en', value=label_pl)
+
+            wbi_new_item.descriptions.set(language='pl', value=description_pl)
+            wbi_new_item.descriptions.set(language='en', value=description_en)
+            
+            if claims:
+                wbi_new_item.claims.add(claims)
+            if not write:
+                return wbi_new_item
+            return write_item(wbi_new_item)
+        else: 
+            logger.debug('Item already exists in Wikibase with ID = %s', potential_item_id)
+            if offline:
+                potential_item = new_item_entity()
+                potential_item.id = potential_item_id
+                return potential_item
+            potential_item = get_item(potential_item_id)
+            if claims:
+                potential_item.claims.add(claims)
+                if write and dump_writer is not None:
+                    logger.warning('Item %s already exists, its new statements are not exported', potential_item_id)
+                elif write:
+                    potential_item = write_item(potential_item)
+            return potential_item
+
+
+def write_item(wbi_item: entities.item.ItemEntity) -> entities.item.ItemEntity:
+    """
+    Writes the complete item (labels, descriptions, aliases and all claims with qualifiers and references)
+    to Wikibase in one 'wbeditentity' call (or to the dump in export mode), stores the written entity in
+    the entity cache and remembers the ID of a new item for later lookups
+    Args:
+        wbi_item (entities.item.ItemEntity): item entity to be written
+    Returns:
+        entities.item.ItemEntity: written item entity
+    """
+    is_new = wbi_item.id is None
+    if offline or dump_writer is not None:
+        if is_new:
+            wbi_item.id = 'Q' + str(next(_placeholder_ids))
+            if dump_writer is not None:
+                dump_writer.write(wbi_item.get_json())
+            else:
+                planned_items.append(wbi_item.get_json())
+        result = wbi_item
+    else:
+        try:
+            entity_json = _edit_entity(wbi_item)
+        except Exception:
+            if not is_new:
+                # the cached entity may be outdated (e.g. edit conflict)
+                entity_cache.remove([wbi_item.id])
+            raise
+        entity_cache.set(entity_json)
+        result = wbi_item.from_json(entity_json)
+    if is_new:
+        remember_new_item(result)
+    return result
+
+
+def _edit_entity(wbi_item: entities.item.ItemEntity) -> dict:
+    # like wbi_item.write(), but the complete entity JSON from the response is also kept for the entity cache
+    for attempt in range(2):
+        try:
+            return wbi_helpers.edit_entity(data=wbi_item.get_json(), id=wbi_item.id, type=wbi_item.type,
+                                           is_bot=wbi_item.api.is_bot, login=wbi_item.api.login)['entity']
+        except MWApiError as e:
+            if e.code != 'badtoken' or attempt:
+                raise
+            logger.warning('Edit token was rejected, retrying with a new one')
+            session.refresh_edit_token()
+
+
+def remember_new_item(wbi_item: entities.item.ItemEntity):
+    """
+    Registers just created item for later lookups by its label and description and by its label and class
+    ('instance of' values), so they are answered without searching (the search index may not contain 
+    the item yet)
+    Args:
+        wbi_item (entities.item.ItemEntity): written new item entity
+    """
+    # empty values are not stored by wbi (e.g. a person without dates and positions has no description)
+    label = wbi_item.labels.get('pl')
+    description = wbi_item.descriptions.get('pl')
+    label_pl = label.value if label is not None else ''
+    description_pl = description.value if description is not None else ''
+    set_known_item_id(label_pl, 'description', description_pl, wbi_item.id)
+    set_known_item_id(label_pl, 'description', '', wbi_item.id)
+    for claim in wbi_item.claims.claims.get(INSTANCE_OF_PROPERTY, []):
+        class_id = get_datavalue_id(claim.mainsnak.datavalue)
+        if class_id:
+            set_known_item_id(label_pl, INSTANCE_OF_PROPERTY, class_id, wbi_item.id)
+    logger.info('Item %s was added, ID = %s', label_pl, wbi_item.id)
+
+
+def _get_snak_signature(snak_json: dict) -> list:
+    datavalue = snak_json.get('datavalue')
+    if datavalue and datavalue.get('type') == 'wikibase-entityid':
+        # the API returns numeric IDs as integers, statements built locally may have them as strings
+        value = dict(datavalue['value'])
+        if 'numeric-id' in value:
+            value['numeric-id'] = int(value['numeric-id'])
+        if 'id' not in value and value.get('entity-type') == 'item':
+            value['id'] = 'Q' + str(value['numeric-id'])
+        datavalue = {'type': datavalue['type'], 'value': value}
+    return [snak_json.get('property'), snak_json.get('snaktype'), datavalue]
+
+
+def get_statement_signature(claim: Claim, include_qualifiers: bool = True, include_references: bool = False) -> str:
+    """
+    Computes signature of the statement (property, value and qualifiers, without IDs and hashes),
+    so that the same statement built twice can be recognized
+    Args:
+        claim (Claim): statement of the item
+        include_qualifiers (bool): if False, only the property and the value are compared
+        include_references (bool): if True, references are compared too
+    Returns:
+        str: signature of the statement
+    """
+    claim_json = claim.get_json()
+    signature = [_get_snak_signature(claim_json['mainsnak'])]
+    if include_qualifiers:
+        qualifiers = [_get_snak_signature(snak) for snaks in claim_json.get('qualifiers', {}).values() for snak in snaks]
+        signature.append(sorted(qualifiers, key=json.dumps))
+    if include_references:
+        references = [sorted((_get_snak_signature(snak) for snaks in reference.get('snaks', {}).values() for snak in snaks),
+                             key=json.dumps) for reference in claim_json.get('references', [])]
+        signature.append(sorted(references, key=json.dumps))
+    return json.dumps(signature, sort_keys=True, ensure_ascii=False)
+
+
+def get_statement_signatures(wbi_item: entities.item.ItemEntity) -> List[str]:
+    """
+    Args:
+        wbi_item (entities.item.ItemEntity): item entity
+    Returns:
+        List[str]: signatures of all statements of the item
+    """
+    return [get_statement_signature(claim) for claims in wbi_item.claims.claims.values() for claim in claims]
+
+
+def get_content_signature(wbi_item: entities.item.ItemEntity) -> str:
+    """
+    Computes signature of the whole content of the item (labels, descriptions, aliases and statements
+    with qualifiers and references, without IDs, hashes and order), e.g. to find out if adding statements
+    to an existing item changed anything
+    Args:
+        wbi_item (entities.item.ItemEntity): item entity
+    Returns:
+        str: signature of the item
+    """
+    item_json = wbi_item.get_json()
+    aliases = { language: sorted(alias['value'] for alias in aliases if 'remove' not in alias)
+                for language, aliases in item_json.get('aliases', {}).items() }
+    statements = sorted(get_statement_signature(claim, include_references=True)
+                        for claims in wbi_item.claims.claims.values() for claim in claims if not claim.removed)
+    return json.dumps([item_json.get('labels'), item_json.get('descriptions'), aliases, statements], sort_keys=True,
+                      ensure_ascii=False)
+
 
-        wbi_new_item.descriptions.set(language='pl', value=description_pl)
-        wbi_new_item.descriptions.set(language='en', value=description_en)
-        
-        result = wbi_new_item.write()
-        print('Item', label_pl, 'was added, ID =', result.id)
-        return result
-    else: 
-        print('Item already exists in Wikibase with ID =', potential_item_id)
-        potential_item = wbi.item.get(entity_id=potential_item_id)
-        return potential_item
+def remove_existing_statements(wbi_item: entities.item.ItemEntity) -> int:
+    """
+    Removes from the item new (not yet written) statements which are identical to statements already
+    existing in Wikibase, so that only missing statements are written
+    Args:
+        wbi_item (entities.item.ItemEntity): item entity
+    Returns:
+        int: number of removed statements
+    """
+    removed = 0
+    for prop_id, claims in wbi_item.claims.claims.items():
+        existing_signatures = {get_statement_signature(claim) for claim in claims if claim.id}
+        kept_claims = [claim for claim in claims if claim.id or get_statement_signature(claim) not in existing_signatures]
+        removed += len(claims) - len(kept_claims)
+        wbi_item.claims.claims[prop_id] = kept_claims
+    return removed
 
 
 def search_for_item_with_property(label: str, prop_id: str, prop_value_id: str) -> str: 
@@ -87,21 +563,90 @@ def search_for_item_with_property(label: str, prop_id: str, prop_value_id: str)
         prop_id (str): ID of the property to check
         prop_value_id (str): ID of the value of the property to check 
     Returns:
-        str: ID of the existing item or an empty string 
+        str: ID of the existing item or an empty string (also if the label or the value is empty)
     """
-    search_result = wbi_helpers.search_entities(search_string=label)
-    if search_result != []:
-        for item_id in search_result:
-            item = wbi.item.get(entity_id=item_id)
-            if label == item.labels.get('pl'):
-                try:
-                    item_property_value = item.claims.get(prop_id)[0].mainsnak.datavalue['value']
-                    if 'entity-type' in item_property_value and item_property_value['entity-type'] == 'item':
-                        item_property_value = item_property_value['id']
-                    if item_property_value == prop_value_id:
-                        return item_id
-                except KeyError:
-                    continue
-    else:
+    if not label or not prop_value_id:
         return ''
+    cached_id = get_known_item_id(label, prop_id, prop_value_id)
+    if cached_id is not None:
+        return cached_id
+    item_id = _search_for_item_with_property(label, prop_id, prop_value_id) or ''
+    set_known_item_id(label, prop_id, prop_value_id, item_id)
+    return item_id
+
+
+def get_or_create_item_with_property(label: str, prop_id: str, prop_value_id: str, description_pl: str,
+                                     description_en: str) -> str:
+    """
+    Returns the ID of the item with given label and property value (e.g. given name), creating the item 
+    with this property if it does not exist; in sharded mode the coordinator is asked for unknown items
+    Args:
+        label (str): label of the item in Polish
+        prop_id (str): ID of the property
+        prop_value_id (str): ID of the value of the property
+        description_pl (str): description of the new item in Polish
+        description_en (str): description of the new item in English
+    Returns:
+        str: ID of the existing or created item
+    """
+    with get_key_lock((label, prop_id, prop_value_id)):
+        if vocabulary_coordinator is not None:
+            item_id = get_known_item_id(label, prop_id, prop_value_id)
+            if not item_id:
+                item_id = vocabulary_coordinator.get_or_create_item_with_property(label, prop_id, prop_value_id,
+                                                                                  description_pl, description_en)
+                preresolved_items[(label, prop_id, prop_value_id)] = item_id
+            return item_id
+        item_id = search_for_item_with_property(label, prop_id, prop_value_id)
+        if not item_id:
+            new_item = add_new_item(label, description_pl, description_en, claims=[Item(value=prop_value_id, prop_nr=prop_id)],
+                                    check_existing=False)
+            item_id = new_item.id
+            if prop_id != INSTANCE_OF_PROPERTY:
+                # new items are registered only by their class (see remember_new_item)
+                set_known_item_id(label, prop_id, prop_value_id, item_id)
+        return item_id
+
 
+def get_or_create_item(label: str, description_pl: str, description_en: str, prop_id: str, prop_value_id: str) -> str:
+    """
+    Returns the ID of the item with given label (and any description, e.g. office), creating the item
+    with given descriptions and property value if it does not exist; in sharded mode the coordinator 
+    is asked for unknown items
+    Args:
+        label (str): label of the item in Polish
+        description_pl (str): description of the new item in Polish
+        description_en (str): description of the new item in English
+        prop_id (str): ID of the property of the new item (e.g. 'instance of')
+        prop_value_id (str): ID of the value of the property
+    Returns:
+        str: ID of the existing or created item
+    """
+    with get_key_lock((label, 'description', '')):
+        if vocabulary_coordinator is not None:
+            item_id = get_known_item_id(label, 'description', '')
+            if not item_id:
+                item_id = vocabulary_coordinator.get_or_create_item(label, description_pl, description_en,
+                                                                    prop_id, prop_value_id)
+                preresolved_items[(label, 'description', '')] = item_id
+            return item_id
+        item_id = check_if_item_exists(label, '', remember_missing=False)
+        if not item_id:
+            item_id = add_new_item(label, description_pl, description_en, claims=[Item(value=prop_value_id, prop_nr=prop_id)],
+                                   check_existing=False).id
+        return item_id
+
+
+def _search_for_item_with_property(label: str, prop_id: str, prop_value_id: str) -> str: 
+    if exact_lookup.is_sparql_available():
+        try:
+            return exact_lookup.lookup_item_with_property(label, prop_id, prop_value_id)
+        except sparql.SparqlError as e:
+            exact_lookup.disable_sparql(e)
+    search_result = wbi_helpers.search_entities(search_string=label)
+    items = get_item_summaries(search_result, [prop_id])
+    for item_id in search_result:
+        item_summary = items.get(item_id)
+        if item_summary is not None and label == item_summary.label and item_summary.has_property_value(prop_id, prop_value_id):
+            return item_id
+    return ''
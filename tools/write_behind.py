@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+from typing import Callable, Hashable, Iterable, Iterator, Optional, Set
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+
+# marks the end of a queue
+_END = object()
+
+
+def prefetch(iterable: Iterable, queue_size: int = DEFAULT_QUEUE_SIZE, stop_event: Optional[threading.Event] = None) -> Iterator:
+    """
+    Reads elements of the iterable (e.g. persons from xml file) in a background thread, keeping at most
+    given number of elements ready
+    Args:
+        iterable (Iterable): source of elements
+        queue_size (int): maximal number of elements read ahead
+        stop_event (Optional[threading.Event]): when set, no more elements are returned
+    Returns:
+        Iterator: elements of the iterable in the same order
+    """
+    elements = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def read():
+        try:
+            for element in iterable:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                elements.put(element)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            elements.put(_END)
+
+    threading.Thread(target=read, name='reader', daemon=True).start()
+    while stop_event is None or not stop_event.is_set():
+        element = elements.get()
+        if element is _END:
+            break
+        yield element
+    if errors:
+        raise errors[0]
+
+
+class BackgroundWriter:
+    """
+    Writes entries (e.g. prepared items) in a background thread, so that writes overlap with preparing
+    the next entries; the queue is bounded, so submit blocks when the writer falls behind; keys of entries
+    are reserved before they are prepared (see reserve), so that two entries with the same key are never
+    prepared or written at the same time; after the first failed write the remaining entries are dropped
+    and the error is raised by the next call
+    """
+
+    def __init__(self, write: Callable[[object], None], queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        Args:
+            write (Callable[[object], None]): function writing one entry
+            queue_size (int): maximal number of entries waiting to be written
+        """
+        self.write = write
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.reserved: Set[Hashable] = set()
+        self.error: Optional[Exception] = None
+        self._released = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='writer', daemon=True)
+        self._thread.start()
+
+    def reserve(self, key: Hashable):
+        """
+        Waits until the previous entry with given key (if any) is written and reserves the key, e.g. before
+        the person is looked up, so that a repeated person finds the item written for its previous occurrence;
+        the key must be then released or an entry must be submitted with it
+        Args:
+            key (Hashable): key of the entry
+        """
+        self._raise_error()
+        with self._released:
+            self._released.wait_for(lambda: key not in self.reserved)
+            self.reserved.add(key)
+
+    def release(self, key: Hashable):
+        """
+        Releases the reserved key without submitting an entry (e.g. nothing has to be written)
+        Args:
+            key (Hashable): key of the entry
+        """
+        with self._released:
+            self.reserved.discard(key)
+            self._released.notify_all()
+
+    def submit(self, key: Hashable, entry: object):
+        """
+        Adds the entry to the queue (blocks while the queue is full); the key is released when the entry
+        is written (or dropped)
+        Args:
+            key (Hashable): reserved key of the entry (see reserve)
+            entry (object): entry to be written
+        """
+        try:
+            self._raise_error()
+            self.queue.put((key, entry))
+        except BaseException:
+            self.release(key)
+            raise
+
+    def close(self):
+        """
+        Writes all submitted entries and stops the background thread
+        """
+        self.queue.put(_END)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            element = self.queue.get()
+            try:
+                if element is _END:
+                    return
+                key, entry = element
+                try:
+                    if self.error is None:
+                        self.write(entry)
+                except Exception as e:
+                    logger.error('Write failed, remaining entries are dropped: %s', e)
+                    self.error = e
+                finally:
+                    self.release(key)
+            finally:
+                self.queue.task_done()
@@ -1,25 +1,188 @@
-from typing import Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
+import gzip
 import xml.etree.ElementTree as ET
+import zlib
 
 
-def get_label_and_description(person: ET.Element) -> Tuple[str, str]:
+GZIP_MAGIC_NUMBER = b'\x1f\x8b'
+
+
+def iter_persons(data_file_path: str, start: int = 0) -> Iterator[ET.Element]:
+    """
+    Reads given xml file (plain or gzip-compressed) incrementally and yields one person element at a time;
+    processed elements are detached from the tree, so memory usage does not depend on the size of the file
+    Args:
+        data_file_path (str): path to the xml file with persons data
+        start (int): number of persons to skip from the beginning of the file
+    Returns:
+        Iterator[ET.Element]: objects from xml with all data about one person
+    """
+    with open(data_file_path, 'rb') as raw_file:
+        is_compressed = raw_file.read(2) == GZIP_MAGIC_NUMBER
+    data_file = gzip.open(data_file_path, 'rb') if is_compressed else open(data_file_path, 'rb')
+    with data_file:
+        root = None
+        depth = 0
+        index = 0
+        for event, element in ET.iterparse(data_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and element.tag == 'person':
+                root.clear()
+                if index >= start:
+                    yield element
+                index += 1
+
+
+class Position:
+    """
+    Data about one position held by a person
+    """
+    __slots__ = ('office', 'start_date', 'end_date', 'date')
+
+    def __init__(self, office: str, start_date: str = '', end_date: str = '', date: str = ''):
+        self.office = office
+        self.start_date = start_date
+        self.end_date = end_date
+        self.date = date
+
+
+class Person:
+    """
+    Data about one person extracted from xml (missing fields are None or empty lists), optionally
+    with the original xml fragment
+    """
+    __slots__ = ('name', 'surname', 'location', 'coat_of_arms', 'date_of_birth', 'date_of_death', 'floruit',
+                 'place_of_birth', 'place_of_birth_prng', 'stated_as', 'positions', 'bibliography', 'xml')
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.surname: Optional[str] = None
+        self.location: Optional[str] = None
+        self.coat_of_arms: Optional[str] = None
+        self.date_of_birth: Optional[str] = None
+        self.date_of_death: Optional[str] = None
+        self.floruit: Optional[str] = None
+        self.place_of_birth: Optional[str] = None
+        self.place_of_birth_prng: Optional[str] = None
+        self.stated_as: List[Tuple[str, str]] = []
+        self.positions: List[Position] = []
+        self.bibliography: List[str] = []
+        self.xml: Optional[str] = None
+
+
+PERSON_TEXT_FIELDS = { 'name', 'surname', 'location', 'coat_of_arms', 'date_of_birth', 'date_of_death', 'floruit' }
+
+
+def parse_person(element: ET.Element) -> Person:
+    """
+    Walks once over the xml element with data about a person and extracts all its fields
+    Args:
+        element (ET.Element): object from xml with all data about one person
+    Returns:
+        Person: record with data about the person
+    """
+    person = Person()
+    for child in element:
+        tag = child.tag
+        if tag in PERSON_TEXT_FIELDS:
+            setattr(person, tag, child.text)
+        elif tag == 'stated_as':
+            person.stated_as.append((child.text, child.attrib['lang']))
+        elif tag == 'place_of_birth':
+            for place_child in child:
+                if place_child.tag == 'place':
+                    person.place_of_birth = place_child.text
+                elif place_child.tag == 'prng':
+                    person.place_of_birth_prng = place_child.text
+        elif tag == 'positions':
+            person.positions.extend(get_office_details(position) for position in child if position.tag == 'position')
+        elif tag == 'bibliography':
+            person.bibliography.extend(biblio.text for biblio in child if biblio.tag == 'biblio' and biblio.text)
+    return person
+
+
+def get_xml_fragment(element: ET.Element) -> str:
+    """
+    Args:
+        element (ET.Element): object from xml
+    Returns:
+        str: xml text of the element
+    """
+    return ET.tostring(element, encoding='unicode').strip()
+
+
+def iter_person_records(data_file_path: str, start: int = 0, shard: int = 0, shards: int = 1, keep_xml: bool = False,
+                        on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[Person]:
+    """
+    Reads given xml file incrementally (see iter_persons) and yields records with data about persons;
+    xml elements are freed as soon as they are parsed
+    Args:
+        data_file_path (str): path to the xml file with persons data
+        start (int): number of persons to skip from the beginning of the file
+        shard (int): number of the shard to be read (see get_person_shard)
+        shards (int): number of all shards
+        keep_xml (bool): if True, records keep the xml fragments of persons
+        on_error (Optional[Callable[[str, Exception], None]]): if given, it is called with the xml fragment
+        and the error of each person which cannot be parsed and the person is skipped
+    Returns:
+        Iterator[Person]: records with data about persons
+    """
+    for index, element in enumerate(iter_persons(data_file_path, start)):
+        person = None
+        try:
+            person = parse_person(element)
+            if shards > 1 and get_person_shard(person, shards) != shard:
+                person = None
+        except Exception as e:
+            # persons which cannot be parsed are reported by one shard only
+            if index % shards == shard:
+                if on_error is None:
+                    raise
+                on_error(get_xml_fragment(element), e)
+        if person is not None and keep_xml:
+            person.xml = get_xml_fragment(element)
+        element.clear()
+        if person is not None:
+            yield person
+
+
+def get_person_shard(person: Person, shards: int) -> int:
+    """
+    Assigns the person to a shard by its label and description, so that all occurrences of the same person
+    (the same item in Wikibase) are imported by the same shard
+    Args:
+        person (Person): record with all data about one person
+        shards (int): number of all shards
+    Returns:
+        int: number of the shard
+    """
+    label, description = get_label_and_description(person)
+    return zlib.crc32((label + '\n' + description).encode('utf-8')) % shards
+
+
+def get_label_and_description(person: Person) -> Tuple[str, str]:
     """
     Constructs label (name, surname, location) and description (years of life, offices held) 
-    from the given xml data about a person
+    from the given data about a person
     Args:
-        person (ET.Element): object from xml with all data about one person 
+        person (Person): record with all data about one person 
     Returns:
         Tuple[str, str]: complete label and description
     """
-    name = person.find('name').text + " " if person.find('name') is not None else ""
-    surname = person.find('surname').text + " " if person.find('surname') is not None else ""
-    location = person.find('location').text if person.find('location') is not None else ""
+    name = person.name + " " if person.name is not None else ""
+    surname = person.surname + " " if person.surname is not None else ""
+    location = person.location if person.location is not None else ""
             
     label = name + surname + location
     
-    birth_date = person.find('date_of_birth').text if person.find('date_of_birth') is not None else ""
-    death_date = person.find('date_of_death').text if person.find('date_of_death') is not None else ""
-    floruit = person.find('floruit').text if person.find('floruit') is not None else ""
+    birth_date = person.date_of_birth if person.date_of_birth is not None else ""
+    death_date = person.date_of_death if person.date_of_death is not None else ""
+    floruit = person.floruit if person.floruit is not None else ""
     
     if "-" in birth_date:
         birth_date = birth_date[-4:]
@@ -38,9 +201,7 @@ def get_label_and_description(person: ET.Element) -> Tuple[str, str]:
     else:
         description = ""
     
-    offices_elements = person.findall('./positions/position/office')
-    offices_list = [x.text for x in offices_elements]
-    offices_string = ', '.join(offices_list)
+    offices_string = ', '.join(position.office for position in person.positions)
     description = description + offices_string
     
     label = label.strip()
@@ -49,49 +210,33 @@ def get_label_and_description(person: ET.Element) -> Tuple[str, str]:
     return label, description
 
 
-def get_office_details(position: ET.Element) -> Tuple[str, str, str, str]:
+def get_office_details(position: ET.Element) -> Position:
     """
     Checks which details about a position are given and returns texts from them 
     Args:
         position (ET.Element): object from xml with all data about one position 
     Returns:
-        Tuple[str, str, str, str]: texts from existing fields (office, start date, end date, date) 
-        or empty strings 
+        Position: texts from existing fields (office, start date, end date, date) or empty strings 
+    Raises:
+        ValueError: if the office is not given (the person cannot be imported without it)
     """
-    office = position.find('office')
-    start_date = position.find('start_date')
-    end_date = position.find('end_date')
-    date = position.find('date')
-    
-    office_text = office.text
-    start_date_text = ''
-    end_date_text = ''
-    date_text = ''
-        
-    if start_date is not None:
-        start_date_text = start_date.text
-        
-    if end_date is not None:
-        end_date_text = end_date.text
-        
-    if date is not None:
-        date_text = date.text
-    
-    return office_text, start_date_text, end_date_text, date_text
+    office_position = Position(office='')
+    for child in position:
+        if child.tag in Position.__slots__:
+            setattr(office_position, child.tag, child.text or '')
+    if not office_position.office.strip():
+        raise ValueError('Position without office: ' + ET.tostring(position, encoding='unicode').strip())
+    return office_position
 
 
-def get_source_title_and_pages(source: ET.Element) -> Tuple[str, str]:
+def get_source_title_and_pages(biblio: str) -> Tuple[str, str]:
     """
-    Retrieves data about the source title and related pages from given xml element 
+    Retrieves data about the source title and related pages from given bibliography item 
     Args:
-        source (ET.Element): object from xml with bibliography item data
+        biblio (str): text of the bibliography item
     Returns:
-        Tuple[str, str]: source title (perhaps with volume) and specific pages 
+        Tuple[str, str]: source title (perhaps with volume) and specific pages (empty if not given)
     """
-    title = ''
-    pages = ''
-    bibliography = source.find('biblio')
-    title = bibliography.text.split(', s.')[0]
-    pages = bibliography.text.split('s. ')[1]
+    title = biblio.split(', s.')[0]
+    pages = biblio.split('s. ')[1] if 's. ' in biblio else ''
     return title, pages
-